@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CurrencyAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'currency_app'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from .db import configure_sqlite
+        from .metrics import install_query_counter
+        connection_created.connect(configure_sqlite)
+        connection_created.connect(install_query_counter)
@@ -0,0 +1,215 @@
+from dataclasses import dataclass
+from decimal import Decimal
+from django.conf import settings
+from django.db import IntegrityError, connections, models, router, transaction
+from django.utils import timezone
+from .db import COPY_THRESHOLD, copy_insert, supports_copy
+
+
+DEFAULT_BATCH_SIZE = 500
+
+
+@dataclass
+class UpsertResult:
+    """
+    Итог пакетной синхронизации.
+    inserted - количество добавленных записей.
+    updated - количество изменённых записей.
+    unchanged - количество записей, совпавших с уже имеющимися.
+    """
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+
+    def __add__(self, other: 'UpsertResult') -> 'UpsertResult':
+        return UpsertResult(
+            self.inserted + other.inserted,
+            self.updated + other.updated,
+            self.unchanged + other.unchanged
+        )
+
+    @property
+    def total(self) -> int:
+        return self.inserted + self.updated + self.unchanged
+
+
+def get_batch_size(batch_size: int | None = None) -> int:
+    return batch_size or getattr(
+        settings, 'CURRENCY_SYNC_BATCH_SIZE', DEFAULT_BATCH_SIZE
+    )
+
+
+def normalize_value(field: models.Field, value):
+    """
+    Приведение значения к виду, в котором его вернёт база данных,
+    чтобы сравнение с уже сохранённой записью было корректным.
+    """
+    if value is None:
+        return None
+    value = field.to_python(value)
+    if isinstance(field, models.DecimalField) and isinstance(value, Decimal):
+        value = value.quantize(Decimal(1).scaleb(-field.decimal_places))
+    return value
+
+
+def has_unique_key(model: type[models.Model], unique_fields: list[str]) -> bool:
+    key = set(unique_fields)
+    if len(key) == 1 and model._meta.get_field(unique_fields[0]).unique:
+        return True
+    return any(set(fields) == key for fields in model._meta.unique_together)
+
+
+def supports_conflict_update(
+        model: type[models.Model], unique_fields: list[str]) -> bool:
+    """
+    Проверка, можно ли обновлять записи через INSERT ... ON CONFLICT:
+    нужна уникальность по ключу и поддержка со стороны базы данных.
+    """
+    connection = connections[router.db_for_write(model)]
+    if not connection.features.supports_update_conflicts_with_target:
+        return False
+    return has_unique_key(model, unique_fields)
+
+
+def insert_new(
+        model: type[models.Model],
+        objs: list,
+        unique_fields: list[str],
+        write_fields: list[str],
+        batch_size: int,
+        conflict_update: bool
+        ) -> None:
+    """
+    Вставка записей, которых не было при чтении существующих. Пока шло
+    сравнение, их мог добавить другой процесс синхронизации, поэтому
+    конфликт по ключу не считается ошибкой: запись обновляется
+    (ON CONFLICT DO UPDATE), а без такой поддержки - пропускается.
+    COPY конфликты не обрабатывает: при ошибке вставка повторяется
+    обычным INSERT.
+    """
+    if supports_copy(model) and len(objs) >= COPY_THRESHOLD:
+        try:
+            with transaction.atomic(using=router.db_for_write(model)):
+                copy_insert(model, objs)
+            return
+        except IntegrityError:
+            pass
+    if conflict_update:
+        model.objects.bulk_create(
+            objs,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=write_fields
+        )
+    else:
+        connection = connections[router.db_for_write(model)]
+        model.objects.bulk_create(
+            objs,
+            batch_size=batch_size,
+            ignore_conflicts=(
+                connection.features.supports_ignore_conflicts
+                and has_unique_key(model, unique_fields)
+            )
+        )
+
+
+def chunked(rows: list, size: int):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def bulk_upsert(
+        model: type[models.Model],
+        rows: list[dict],
+        unique_fields: list[str],
+        update_fields: list[str],
+        batch_size: int | None = None
+        ) -> UpsertResult:
+    """
+    Пакетная синхронизация записей вместо построчного update_or_create.
+    Для каждого пакета одним запросом загружаются существующие записи,
+    после чего новые добавляются через bulk_create, а изменившиеся
+    обновляются через INSERT ... ON CONFLICT (если ключ уникален в базе)
+    либо через bulk_update. Совпадающие записи не трогаются, у изменённых
+    обновляются и поля с auto_now (время изменения записи).
+    Новые записи всех пакетов вставляются в конце (см. insert_new);
+    в PostgreSQL, если их не меньше COPY_THRESHOLD, - одной командой COPY.
+    """
+    batch_size = get_batch_size(batch_size)
+    write_fields = update_fields + [
+        field.name for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) and field.name not in update_fields
+    ]
+    fields = {
+        name: model._meta.get_field(name)
+        for name in unique_fields + update_fields
+    }
+    result = UpsertResult()
+    conflict_update = supports_conflict_update(model, unique_fields)
+
+    # Последняя запись с одинаковым ключом побеждает, как и при
+    # последовательных вызовах update_or_create.
+    keyed = {}
+    for row in rows:
+        row = {
+            name: normalize_value(fields[name], row[name]) for name in fields
+        }
+        keyed[tuple(row[name] for name in unique_fields)] = row
+    unique_rows = list(keyed.items())
+
+    to_create = []
+    for batch in chunked(unique_rows, batch_size):
+        lookup = {
+            f'{name}__in': {key[i] for key, _ in batch}
+            for i, name in enumerate(unique_fields)
+        }
+        existing = {
+            tuple(getattr(obj, name) for name in unique_fields): obj
+            for obj in model.objects.filter(**lookup).only(
+                'pk', *fields
+            )
+        }
+        to_update = []
+        changed_rows = []
+        for key, row in batch:
+            obj = existing.get(key)
+            if obj is None:
+                to_create.append(model(**row))
+                continue
+            if all(
+                normalize_value(fields[name], getattr(obj, name)) == row[name]
+                for name in update_fields
+            ):
+                result.unchanged += 1
+                continue
+            for name in update_fields:
+                setattr(obj, name, row[name])
+            for name in write_fields[len(update_fields):]:
+                setattr(obj, name, timezone.now())
+            to_update.append(obj)
+            changed_rows.append(model(**row))
+
+        if to_update and conflict_update:
+            # Один INSERT ... ON CONFLICT DO UPDATE на пакет заметно
+            # быстрее, чем UPDATE ... CASE WHEN, который строит bulk_update.
+            model.objects.bulk_create(
+                changed_rows,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=unique_fields,
+                update_fields=write_fields
+            )
+        elif to_update:
+            model.objects.bulk_update(
+                to_update, write_fields, batch_size=batch_size
+            )
+        result.updated += len(to_update)
+
+    if to_create:
+        insert_new(
+            model, to_create, unique_fields, write_fields, batch_size,
+            conflict_update
+        )
+    result.inserted += len(to_create)
+    return result
@@ -0,0 +1,46 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError
+from .models import DataVersion
+
+
+def get_chart_cache():
+    """
+    Кэш для построенных графиков (алиас CHART_CACHE_ALIAS в настройках).
+    """
+    return caches[getattr(settings, 'CHART_CACHE_ALIAS', 'default')]
+
+
+def get_data_version() -> int:
+    """
+    Текущая версия данных. Увеличивается при каждой записи в таблицы
+    курсов, поэтому ключи, построенные на старой версии, перестают
+    использоваться и со временем вытесняются из кэша.
+    Хранится в базе (DataVersion), а не в кэше Django: кэш по умолчанию
+    у каждого процесса свой, и веб-сервер не видел бы записей,
+    сделанных обработчиком очереди.
+    """
+    try:
+        return DataVersion.current()
+    except DatabaseError:
+        # Таблицы ещё не созданы (до manage.py migrate)
+        return 0
+
+
+def bump_data_version():
+    DataVersion.bump()
+
+
+def chart_cache_key(currencies, start_date, end_date, base_date, version) -> str:
+    """
+    Ключ графика: набор валют, период, базовая дата и версия данных.
+    """
+    raw = '|'.join([
+        ','.join(sorted(currencies)),
+        str(start_date),
+        str(end_date),
+        str(base_date),
+        str(version)
+    ])
+    return 'currency_app:chart:' + hashlib.sha1(raw.encode()).hexdigest()
@@ -0,0 +1,80 @@
+import asyncio
+import base64
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from .metrics import span
+
+
+def render_relative_changes(series: dict) -> str:
+    """
+    Построение графика относительных изменений, PNG в base64.
+    series - {валюта: (даты, значения)}.
+
+    Используется объектный API matplotlib: для каждого графика создаётся
+    свой Figure с холстом Agg, без глобального состояния pyplot. Поэтому
+    графики из параллельных запросов не смешиваются, а фигура не
+    регистрируется в pyplot и не остаётся в памяти после построения.
+    """
+    figure = Figure(figsize=(10, 6))
+    FigureCanvasAgg(figure)
+    try:
+        axes = figure.subplots()
+        for currency, (dates, values) in series.items():
+            axes.plot(dates, values, label=currency)
+
+        axes.set_xlabel('Дата')
+        axes.set_ylabel('Относительное изменение(%)')
+        axes.set_title('Относительное изменение курса валют, %')
+        axes.legend()
+        axes.grid(True)
+        with span('chart_render'), io.BytesIO() as buffer:
+            figure.savefig(buffer, format='png')
+            image_png = buffer.getvalue()
+    finally:
+        figure.clear()
+    with span('chart_encode'):
+        return base64.b64encode(image_png).decode('utf-8')
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_render_executor() -> ProcessPoolExecutor:
+    """
+    Пул процессов для построения графиков из асинхронных представлений
+    (CHART_RENDER_WORKERS, по умолчанию по числу ядер). Построение
+    занимает процессор, поэтому в потоке оно держало бы GIL и задерживало
+    цикл событий; в отдельном процессе цикл продолжает обслуживать
+    другие запросы. Процессы запускаются через spawn: форк процесса
+    с потоками сервера небезопасен.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(
+                    settings, 'CHART_RENDER_WORKERS', os.cpu_count()
+                ),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+    return _executor
+
+
+async def render_relative_changes_async(series: dict) -> str:
+    """
+    render_relative_changes в пуле процессов без блокировки цикла событий.
+    """
+    loop = asyncio.get_running_loop()
+    # Замеры внутри render_relative_changes остаются в процессе пула,
+    # поэтому построение замеряется здесь целиком
+    with span('chart_render_async'):
+        return await loop.run_in_executor(
+            get_render_executor(), render_relative_changes, series
+        )
@@ -0,0 +1,73 @@
+import numpy as np
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Прореживание ряда алгоритмом Largest-Triangle-Three-Buckets.
+    Сохраняет форму графика (пики и провалы) при малом числе точек.
+    Возвращает индексы выбранных точек.
+    """
+    size = len(x)
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    # Первая и последняя точки сохраняются, остальные делятся на корзины
+    edges = np.linspace(1, size - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = size - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start = end
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else size
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(areas.argmax())
+        selected[bucket + 1] = previous
+    return selected
+
+
+def bucket_mean(
+        x: np.ndarray,
+        y: np.ndarray,
+        threshold: int
+        ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Прореживание усреднением: ряд делится на threshold равных корзин,
+    для каждой берётся первая дата и среднее значение.
+    """
+    size = len(x)
+    if threshold >= size or threshold < 1:
+        return x, y
+    edges = np.linspace(0, size, threshold + 1).astype(np.int64)[:-1]
+    sums = np.add.reduceat(y.astype(np.float64), edges)
+    counts = np.diff(np.append(edges, size))
+    return x[edges], sums / counts
+
+
+def downsample(
+        dates: list,
+        values: list,
+        threshold: int | None,
+        method: str = 'lttb'
+        ) -> tuple[list, list]:
+    """
+    Прореживание ряда (даты, значения) до threshold точек.
+    method - 'lttb' или 'mean'.
+    """
+    if not threshold or len(dates) <= threshold:
+        return list(dates), list(values)
+    x = np.array(dates, dtype='datetime64[D]')
+    y = np.asarray(values, dtype=np.float64)
+    if method == 'mean':
+        x, y = bucket_mean(x, y, threshold)
+    else:
+        index = lttb(x.astype(np.int64), y, threshold)
+        x, y = x[index], y[index]
+    return x.astype(object).tolist(), y.tolist()
@@ -0,0 +1,163 @@
+import csv
+import importlib.util
+import io
+from itertools import islice
+import pandas as pd
+from django.conf import settings
+from django.db import models
+from django.db.models import Subquery
+from .models import CurrencyRate, RelativeChange, SyncParameter
+
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 5000)
+# Набор данных: модель, выгружаемые столбцы и вычисляемые столбцы
+# (аннотации запроса) среди них
+DATASETS = {
+    'rates': (
+        CurrencyRate,
+        ('date', 'currency', 'rate', 'change', 'currency_code'),
+        {}
+    ),
+    'relative_changes': (
+        RelativeChange,
+        ('date', 'currency', 'relative_change', 'base_date'),
+        {
+            # Изменения посчитаны к базовой дате последней синхронизации
+            'base_date': Subquery(
+                SyncParameter.objects.filter(
+                    param_name='base_date'
+                ).values('param_value')[:1],
+                output_field=models.DateField()
+            ),
+        }
+    ),
+}
+
+
+def parquet_available() -> bool:
+    """
+    pyarrow не входит в requirements.txt: Parquet доступен,
+    только если он установлен (pip install pyarrow).
+    """
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def export_rows(dataset: str, currencies=(), start_date=None, end_date=None):
+    """
+    Строки набора данных (кортежи значений полей) в порядке
+    (валюта, дата) - по индексу (currency, date).
+    Читаются курсором порциями по EXPORT_CHUNK_SIZE, без загрузки
+    всего набора в память.
+    """
+    model, fields, annotations = DATASETS[dataset]
+    queryset = model.objects.annotate(**annotations)
+    if currencies:
+        queryset = queryset.filter(currency__in=currencies)
+    if start_date is not None:
+        queryset = queryset.filter(date__gte=start_date)
+    if end_date is not None:
+        queryset = queryset.filter(date__lte=end_date)
+    return (
+        queryset.order_by('currency', 'date')
+        .values_list(*fields)
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+
+def iter_chunks(rows, size: int = EXPORT_CHUNK_SIZE):
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_csv(dataset: str, rows):
+    """
+    CSV по частям: заголовок и далее по одной части на порцию строк.
+    """
+    _, fields, _ = DATASETS[dataset]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for chunk in iter_chunks(rows):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+class StreamSink(io.RawIOBase):
+    """
+    Файл только для записи: записанные байты забираются через take(),
+    поэтому в памяти остаётся не больше одной группы строк Parquet.
+    """
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def take(self) -> bytes:
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def arrow_schema(dataset: str):
+    """
+    Схема Arrow по полям модели: Decimal сохраняется как decimal128
+    без потери точности.
+    """
+    import pyarrow as pa
+
+    model, fields, annotations = DATASETS[dataset]
+    columns = []
+    for name in fields:
+        if name in annotations:
+            field = annotations[name].output_field
+        else:
+            field = model._meta.get_field(name)
+        if isinstance(field, models.DecimalField):
+            column_type = pa.decimal128(field.max_digits, field.decimal_places)
+        elif isinstance(field, models.DateField):
+            column_type = pa.date32()
+        elif isinstance(field, models.IntegerField):
+            column_type = pa.int64()
+        else:
+            column_type = pa.string()
+        columns.append(pa.field(name, column_type))
+    return pa.schema(columns)
+
+
+def iter_parquet(dataset: str, rows):
+    """
+    Parquet по частям: каждая порция строк собирается в DataFrame
+    pandas и записывается отдельной группой строк (row group).
+    Требует pyarrow (см. parquet_available).
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    _, fields, _ = DATASETS[dataset]
+    schema = arrow_schema(dataset)
+    sink = StreamSink()
+    with pq.ParquetWriter(sink, schema, compression='snappy') as writer:
+        for chunk in iter_chunks(rows):
+            frame = pd.DataFrame(chunk, columns=fields)
+            writer.write_table(
+                pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+            )
+            yield sink.take()
+    yield sink.take()
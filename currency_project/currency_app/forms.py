@@ -5,6 +5,26 @@ from django.core.exceptions import ValidationError
 
 
 
+def parse_pairs(value: str) -> tuple[tuple[str, str], ...]:
+    """
+    Разбор списка пар валют вида "EUR/USD, CNY/JPY".
+    """
+    pairs = set()
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        codes = [code.strip().upper() for code in item.split('/')]
+        if (
+            len(codes) != 2 or codes[0] == codes[1]
+            or not all(len(code) == 3 and code.isalpha() for code in codes)
+        ):
+            raise ValidationError(
+                f"Неверная пара валют: {item.strip()} (пример: EUR/USD)"
+            )
+        pairs.add(tuple(codes))
+    return tuple(sorted(pairs))
+
+
 class DateRangeForm(forms.Form):
     """
     Форма для страницы index - выбор дат.
@@ -48,6 +68,9 @@ class RelativeChangeForm(forms.Form):
     """
     Форма для страницы relative_changes- выбор дат.
     Согласно условию, возможный диапазон не более 2 лет.
+    Базовая дата, относительно которой считается изменение курса,
+    может быть любой; по умолчанию - дата последней синхронизации.
+    Вместо валют или вместе с ними можно указать пары для кросс-курсов.
     """
     
     current_year = date.today().year
@@ -65,11 +88,22 @@ class RelativeChangeForm(forms.Form):
         label='Конец периода'
     )
 
+    base_date = forms.DateField(
+        widget=forms.SelectDateWidget(years=years_range),
+        required=False,
+        label='Базовая дата'
+    )
+
     currency = forms.MultipleChoiceField(
         # choices=currency_codes,
         widget=forms.CheckboxSelectMultiple,
         label='Выбор стран:',
-        error_messages={'required': 'Необходимо выбрать страну'}
+        required=False
+    )
+
+    pairs = forms.CharField(
+        required=False,
+        label='Кросс-курсы (например, EUR/USD, CNY/JPY)'
     )
 
     def __init__(self, *args, **kwargs):
@@ -77,6 +111,8 @@ class RelativeChangeForm(forms.Form):
         super(RelativeChangeForm, self).__init__(*args, **kwargs)
         self.fields['currency'].choices = currency_codes
 
+    def clean_pairs(self):
+        return parse_pairs(self.cleaned_data['pairs'])
 
     def clean(self):
         """
@@ -86,6 +122,12 @@ class RelativeChangeForm(forms.Form):
         start_date = cleaned_data.get('start_date')
         end_date = cleaned_data.get('end_date')
 
+        if (
+            not cleaned_data.get('currency') and not cleaned_data.get('pairs')
+            and 'pairs' not in self.errors
+        ):
+            self.add_error('currency', 'Необходимо выбрать страну')
+
         if start_date and end_date:
             if start_date > end_date:
                 raise ValidationError("Начало периода не может быть позже "
@@ -94,3 +136,80 @@ class RelativeChangeForm(forms.Form):
             if abs((end_date - start_date).days) > 730:
                 raise ValidationError("Разница между началом и концом периода "
                                       "не может быть больше 2 лет.")
+
+
+
+class SeriesQueryForm(forms.Form):
+    """
+    Параметры запроса временных рядов через JSON API.
+    Даты передаются в формате ГГГГ-ММ-ДД, валюты и пары валют
+    (кросс-курсы, например EUR/USD) - через запятую.
+    """
+    KIND_CHOICES = [('relative', 'Относительное изменение'), ('rate', 'Курс')]
+    METHOD_CHOICES = [('lttb', 'LTTB'), ('mean', 'Среднее по периоду')]
+
+    currencies = forms.CharField(required=False)
+    pairs = forms.CharField(required=False)
+    start_date = forms.DateField()
+    end_date = forms.DateField()
+    base_date = forms.DateField(required=False)
+    kind = forms.ChoiceField(choices=KIND_CHOICES, required=False)
+    points = forms.IntegerField(min_value=3, max_value=10000, required=False)
+    method = forms.ChoiceField(choices=METHOD_CHOICES, required=False)
+
+    def clean_currencies(self):
+        currencies = {
+            code.strip().upper()
+            for code in self.cleaned_data['currencies'].split(',')
+            if code.strip()
+        }
+        return tuple(sorted(currencies))
+
+    def clean_pairs(self):
+        return parse_pairs(self.cleaned_data['pairs'])
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start_date = cleaned_data.get('start_date')
+        end_date = cleaned_data.get('end_date')
+        if start_date and end_date and start_date > end_date:
+            raise ValidationError("Начало периода не может быть позже "
+                                  "конца периода.")
+        if (
+            not cleaned_data.get('currencies') and not cleaned_data.get('pairs')
+            and 'pairs' not in self.errors
+        ):
+            self.add_error('currencies', 'Необходимо выбрать валюту')
+        cleaned_data['kind'] = cleaned_data.get('kind') or 'relative'
+        cleaned_data['method'] = cleaned_data.get('method') or 'lttb'
+        return cleaned_data
+
+
+class ExportQueryForm(forms.Form):
+    """
+    Параметры выгрузки данных: формат (csv или parquet), валюты
+    через запятую и период. Без валют и дат выгружается весь набор.
+    """
+    FORMAT_CHOICES = [('csv', 'CSV'), ('parquet', 'Parquet')]
+
+    format = forms.ChoiceField(choices=FORMAT_CHOICES, required=False)
+    currencies = forms.CharField(required=False)
+    start_date = forms.DateField(required=False)
+    end_date = forms.DateField(required=False)
+
+    def clean_currencies(self):
+        return tuple(sorted({
+            code.strip().upper()
+            for code in self.cleaned_data['currencies'].split(',')
+            if code.strip()
+        }))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start_date = cleaned_data.get('start_date')
+        end_date = cleaned_data.get('end_date')
+        if start_date and end_date and start_date > end_date:
+            raise ValidationError("Начало периода не может быть позже "
+                                  "конца периода.")
+        cleaned_data['format'] = cleaned_data.get('format') or 'csv'
+        return cleaned_data
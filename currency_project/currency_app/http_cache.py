@@ -0,0 +1,228 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from operator import itemgetter
+from pathlib import Path
+import requests
+from django.conf import settings
+from requests.utils import get_encoding_from_headers
+
+
+@dataclass
+class CachedResponse:
+    """
+    Ответ сервера или его копия из кэша.
+    from_cache - содержимое взято из кэша (свежая копия или ответ 304).
+    """
+    url: str
+    content: bytes
+    headers: dict = field(default_factory=dict)
+    from_cache: bool = False
+
+    @property
+    def encoding(self) -> str | None:
+        return get_encoding_from_headers(
+            requests.structures.CaseInsensitiveDict(self.headers)
+        )
+
+
+class HTTPCache:
+    """
+    Дисковый кэш ответов с поддержкой условных запросов.
+    Пока копия моложе ttl, сеть не используется. Устаревшая копия
+    проверяется запросом с If-None-Match / If-Modified-Since, и при
+    ответе 304 содержимое берётся с диска. ttl=None - копия не устаревает
+    (для архивов за прошедшие периоды, которые уже не меняются).
+    Рядом с ответом хранится результат его разбора, поэтому неизменившаяся
+    страница не разбирается повторно. Страница, разобранная в пустой
+    результат, не сохраняется. Время последнего использования записи -
+    время изменения её файла .json; по нему prune() удаляет старые записи.
+    """
+    VALIDATORS = ('etag', 'last-modified')
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path(self, url: str, suffix: str) -> Path:
+        key = hashlib.sha1(url.encode()).hexdigest()
+        return self.directory / f'{key}.{suffix}'
+
+    def write(self, path: Path, data: bytes):
+        # Запись через временный файл, чтобы параллельные потоки
+        # не прочитали файл наполовину.
+        handle, temp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(handle, 'wb') as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, path)
+
+    def load(self, url: str) -> tuple[dict, bytes] | None:
+        try:
+            meta = json.loads(self.path(url, 'json').read_bytes())
+            content = self.path(url, 'body').read_bytes()
+        except (OSError, ValueError):
+            return None
+        return meta, content
+
+    def store(self, url: str, headers: dict, content: bytes):
+        self.path(url, 'parsed').unlink(missing_ok=True)
+        self.write(self.path(url, 'body'), content)
+        self.touch(url, headers)
+
+    def touch(self, url: str, headers: dict):
+        meta = {'fetched_at': time.time(), 'headers': headers}
+        self.write(self.path(url, 'json'), json.dumps(meta).encode())
+
+    def mark_used(self, url: str):
+        try:
+            os.utime(self.path(url, 'json'))
+        except OSError:
+            pass
+
+    def discard(self, url: str):
+        for suffix in ('json', 'body', 'parsed'):
+            self.path(url, suffix).unlink(missing_ok=True)
+
+    def prune(
+            self,
+            max_age: float | None = None,
+            max_size: int | None = None
+            ) -> int:
+        """
+        Удаление записей, не использовавшихся дольше max_age секунд,
+        и давно использованных записей сверх max_size байт на диске.
+        Возвращает количество удалённых записей.
+        """
+        files = defaultdict(list)
+        for path in self.directory.iterdir():
+            # Оставшиеся после сбоя временные файлы - отдельные записи
+            files[path.stem].append(path)
+        entries = []
+        for paths in files.values():
+            try:
+                stats = {path: path.stat() for path in paths}
+            except OSError:
+                continue
+            used = max(
+                (stat.st_mtime for path, stat in stats.items()
+                 if path.suffix == '.json'),
+                default=max(stat.st_mtime for stat in stats.values())
+            )
+            size = sum(stat.st_size for stat in stats.values())
+            entries.append((used, size, paths))
+        entries.sort(key=itemgetter(0), reverse=True)
+        now = time.time()
+        total = 0
+        removed = 0
+        for used, size, paths in entries:
+            if (max_age is not None and now - used > max_age) or (
+                    max_size is not None and total + size > max_size):
+                for path in paths:
+                    path.unlink(missing_ok=True)
+                removed += 1
+            else:
+                total += size
+        return removed
+
+    @staticmethod
+    def is_fresh(meta: dict, ttl: float | None) -> bool:
+        return ttl is None or time.time() - meta['fetched_at'] < ttl
+
+    def fresh(self, url: str, ttl: float | None) -> CachedResponse | None:
+        """
+        Копия, которую можно использовать без обращения к сайту;
+        None - копии нет или она устарела.
+        """
+        cached = self.load(url)
+        if cached is None or not self.is_fresh(cached[0], ttl):
+            return None
+        meta, content = cached
+        self.mark_used(url)
+        return CachedResponse(url, content, meta['headers'], True)
+
+    def get(
+            self,
+            session: requests.Session,
+            url: str,
+            ttl: float | None,
+            timeout=None
+            ) -> CachedResponse:
+        cached = self.load(url)
+        request_headers = {}
+        if cached is not None:
+            meta, content = cached
+            if self.is_fresh(meta, ttl):
+                self.mark_used(url)
+                return CachedResponse(url, content, meta['headers'], True)
+            if 'etag' in meta['headers']:
+                request_headers['If-None-Match'] = meta['headers']['etag']
+            if 'last-modified' in meta['headers']:
+                request_headers['If-Modified-Since'] = meta['headers']['last-modified']
+
+        response = session.get(url, headers=request_headers, timeout=timeout)
+        if response.status_code == 304 and cached is not None:
+            meta, content = cached
+            self.touch(url, meta['headers'])
+            return CachedResponse(url, content, meta['headers'], True)
+        response.raise_for_status()
+        headers = {
+            name: response.headers[name]
+            for name in ('content-type', *self.VALIDATORS)
+            if name in response.headers
+        }
+        self.store(url, headers, response.content)
+        return CachedResponse(url, response.content, headers)
+
+    def parsed(self, response: CachedResponse, parse):
+        """
+        Результат parse(response) с сохранением на диск рядом с ответом.
+        """
+        path = self.path(response.url, 'parsed')
+        if response.from_cache:
+            try:
+                return pickle.loads(path.read_bytes())
+            except (OSError, pickle.PickleError, EOFError):
+                pass
+        result = parse(response)
+        if not result:
+            # Страница без таблицы: период без торговых дней или страница
+            # ошибки с кодом 200. Закрытый период кэшируется бессрочно,
+            # поэтому такой ответ не сохраняется, чтобы его можно было
+            # загрузить заново.
+            self.discard(response.url)
+            return result
+        self.write(path, pickle.dumps(result))
+        return result
+
+
+def get_http_cache() -> HTTPCache | None:
+    """
+    Кэш из настроек (HTTP_CACHE['DIR']); None, если кэш отключён.
+    """
+    config = getattr(settings, 'HTTP_CACHE', None)
+    if not config:
+        return None
+    return HTTPCache(config['DIR'])
+
+
+def prune_http_cache() -> int:
+    """
+    Очистка кэша по HTTP_CACHE['MAX_AGE'] (секунды с последнего
+    использования) и HTTP_CACHE['MAX_SIZE'] (байты).
+    """
+    config = getattr(settings, 'HTTP_CACHE', None)
+    if not config:
+        return 0
+    return HTTPCache(config['DIR']).prune(
+        config.get('MAX_AGE'), config.get('MAX_SIZE')
+    )
+
+
+def get_ttl(source: str) -> float | None:
+    config = getattr(settings, 'HTTP_CACHE', None) or {}
+    return config.get('TTL', {}).get(source, 0)
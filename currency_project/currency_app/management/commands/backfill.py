@@ -0,0 +1,130 @@
+import time
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from currency_app.bulk import UpsertResult
+from currency_app.models import CurrencyRate, RelativeChange, SyncParameter
+from currency_app.rollups import refresh_rollups
+from currency_app.sync import SyncRun
+from currency_app.utils import (
+    CurrencyFetcher,
+    RelativeChangeCalculator,
+    SyncPlanner
+)
+
+
+class Command(BaseCommand):
+    """
+    Загрузка истории курсов за произвольный период (без ограничения
+    в 2 года, как в форме). Период делится на части по --chunk-days,
+    курсы валют в каждой части загружаются параллельно.
+    После каждой части её конец сохраняется в SyncParameter, поэтому
+    прерванная загрузка продолжается с места остановки.
+    Команду можно запускать по расписанию (cron): уже загруженные
+    периоды пропускаются SyncPlanner.
+    """
+    help = 'Загрузка истории курсов валют по частям с возможностью продолжения.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('start_date', type=date.fromisoformat,
+                            help='Начало периода, ГГГГ-ММ-ДД.')
+        parser.add_argument('end_date', type=date.fromisoformat,
+                            help='Конец периода, ГГГГ-ММ-ДД.')
+        parser.add_argument(
+            '--chunk-days', type=int, default=365,
+            help='Длина части периода в днях.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=CurrencyFetcher.MAX_WORKERS,
+            help='Количество параллельных загрузок.'
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать заново, не учитывая сохранённый прогресс.'
+        )
+        parser.add_argument(
+            '--skip-relative', action='store_true',
+            help='Не пересчитывать относительные изменения после загрузки.'
+        )
+
+    @staticmethod
+    def checkpoint_name(start_date: date, end_date: date) -> str:
+        return f'backfill:{start_date.isoformat()}:{end_date.isoformat()}'
+
+    def chunks(self, start_date: date, end_date: date, days: int):
+        chunk_start = start_date
+        while chunk_start <= end_date:
+            chunk_end = min(chunk_start + timedelta(days=days - 1), end_date)
+            yield chunk_start, chunk_end
+            chunk_start = chunk_end + timedelta(days=1)
+
+    def handle(self, *args, **options):
+        start_date = options['start_date']
+        end_date = options['end_date']
+        if start_date > end_date:
+            raise CommandError('Начало периода не может быть позже конца периода.')
+        if options['chunk_days'] < 1:
+            raise CommandError('--chunk-days должен быть больше 0.')
+
+        checkpoint = self.checkpoint_name(start_date, end_date)
+        resume_from = start_date
+        if options['restart']:
+            SyncParameter.objects.filter(param_name=checkpoint).delete()
+        else:
+            saved = SyncParameter.objects.filter(param_name=checkpoint).first()
+            if saved is not None:
+                resume_from = saved.param_value + timedelta(days=1)
+                self.stdout.write(f'Продолжение с {resume_from}')
+
+        # Справочники обновляются так же, как при синхронизации:
+        # недоступность их страниц не останавливает загрузку курсов
+        sync_run = SyncRun(start_date, end_date)
+        sync_run.update_countries()
+        currencies = sync_run.update_currencies()
+        started = time.perf_counter()
+        total_rows = 0
+        total_requests = 0
+        for chunk_start, chunk_end in self.chunks(
+                resume_from, end_date, options['chunk_days']):
+            chunk_started = time.perf_counter()
+            plan = SyncPlanner(chunk_start, chunk_end, currencies).plan()
+            fetcher = CurrencyFetcher(
+                chunk_start, chunk_end,
+                max_workers=options['workers'],
+                plan=plan,
+                currencies=currencies
+            )
+            requests_count = len(fetcher.tasks())
+            result = UpsertResult()
+            for batch in fetcher.iter_currency_rate_batches():
+                result += CurrencyRate.synchronize_currency_rates(batch)
+            SyncPlanner.record(fetcher.completed_tasks)
+            if result.inserted or result.updated:
+                refresh_rollups(currencies, chunk_start, chunk_end)
+            SyncParameter.objects.update_or_create(
+                param_name=checkpoint, defaults={'param_value': chunk_end}
+            )
+
+            elapsed = max(time.perf_counter() - chunk_started, 1e-9)
+            total_rows += result.total
+            total_requests += requests_count
+            self.stdout.write(
+                f'{chunk_start} - {chunk_end}: {result.total} строк, '
+                f'{requests_count} запросов, {elapsed:.1f} с '
+                f'({result.total / elapsed:.0f} строк/с, '
+                f'{requests_count / elapsed:.1f} запросов/с); {result}'
+            )
+
+        sync_run.prune_http_cache()
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        self.stdout.write(self.style.SUCCESS(
+            f'Итого: {total_rows} строк, {total_requests} запросов за '
+            f'{elapsed:.1f} с ({total_rows / elapsed:.0f} строк/с, '
+            f'{total_requests / elapsed:.1f} запросов/с)'
+        ))
+
+        base_date = SyncParameter.objects.filter(param_name='base_date').first()
+        if base_date is not None and not options['skip_relative']:
+            calculator = RelativeChangeCalculator(base_date.param_value)
+            RelativeChange.synchronize_relative_changes(
+                calculator.calculate_relative_changes()
+            )
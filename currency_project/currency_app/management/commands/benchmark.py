@@ -0,0 +1,901 @@
+import asyncio
+import os
+import resource
+import statistics
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+from asgiref.sync import async_to_sync
+from bs4 import BeautifulSoup
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.core.cache import cache
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from currency_app.export import (
+    export_rows,
+    iter_csv,
+    iter_parquet,
+    parquet_available
+)
+from currency_app.charts import (
+    render_relative_changes,
+    render_relative_changes_async
+)
+from currency_app.parsers import iter_finmarket_rates
+from currency_app.models import CountryCurrency, CurrencyRate, RelativeChange
+from currency_app.bulk import UpsertResult
+from currency_app.cache import bump_data_version, get_chart_cache
+from currency_app.rollups import refresh_rollups
+from currency_app.series import (
+    cross_rate_series,
+    relative_change_series,
+    rollup_relative_change_series
+)
+from currency_app.utils import (
+    CurrencyFetcher,
+    RelativeChangeCalculator,
+    forward_fill,
+    get_rate_store
+)
+from currency_app.views import CurrencyTuple
+
+
+class Rollback(Exception):
+    """Исключение для отката всех изменений, сделанных замером."""
+
+
+def generate_rates(days: int, currencies: list[str], shift: float = 0) -> list[dict]:
+    """
+    Генерация синтетических курсов валют для замеров.
+    """
+    start = date(2014, 1, 1)
+    data = []
+    for index, currency in enumerate(currencies):
+        for day in range(days):
+            data.append({
+                'date': start + timedelta(days=day),
+                'currency': currency,
+                'rate': round(10 + index + day * 0.01 + shift, 4),
+                'change': round(0.01 + shift, 4),
+                'currency_code': 52000 + index
+            })
+    return data
+
+
+def finmarket_page(days: int) -> bytes:
+    """
+    Синтетическая страница архива finmarket.ru: таблица karramba
+    среди типичной для сайта разметки.
+    """
+    start = date(2014, 1, 1)
+    rows = ''.join(
+        f'<tr><td>{(start + timedelta(days=day)).strftime("%d.%m.%Y")}</td>'
+        f'<td>1</td><td>{f"{90 + day * 0.0001:.4f}".replace(".", ",")}</td>'
+        f'<td>0,0123</td></tr>'
+        for day in range(days)
+    )
+    filler = '<div class="news"><a href="#">Новость</a><p>Текст</p></div>' * 500
+    return (
+        '<html><head><meta charset="windows-1251"><title>Архив</title></head>'
+        f'<body>{filler}<table class="karramba"><thead><tr><th>Дата</th>'
+        '<th>Кол-во</th><th>Курс</th><th>Изменение</th></tr></thead>'
+        f'<tbody>{rows}</tbody></table>{filler}</body></html>'
+    ).encode('windows-1251')
+
+
+def legacy_parse(content: bytes) -> list[tuple]:
+    """
+    Прежний разбор страницы через BeautifulSoup.
+    """
+    soup = BeautifulSoup(content, 'lxml')
+    table = soup.find('table', class_='karramba')
+    result = []
+    for row in table.find('tbody').find_all('tr'):
+        cols = row.find_all('td')
+        result.append((
+            datetime.strptime(cols[0].text.strip(), '%d.%m.%Y').date(),
+            float(cols[2].text.strip().replace(',', '.')),
+            float(cols[3].text.strip().replace(',', '.'))
+        ))
+    return result
+
+
+class SyntheticFetcher(CurrencyFetcher):
+    """
+    Загрузчик без сети: страница каждой валюты генерируется
+    с небольшой задержкой, имитирующей ответ сервера.
+    """
+    DELAY = 0.05
+
+    def __init__(self, start_date, end_date, currencies: list[str], **kwargs):
+        super().__init__(
+            start_date, end_date, http_cache=None,
+            currencies={
+                currency: 52000 + index
+                for index, currency in enumerate(currencies)
+            },
+            **kwargs
+        )
+
+    def fetch_currency(self, currency, code, start_date, end_date):
+        # Ограничения числа и частоты запросов к хосту действуют
+        # так же, как для настоящей загрузки
+        with self.host_limiter.for_url(
+                self.build_url(code, start_date, end_date)):
+            time.sleep(self.DELAY)
+        days = (end_date - start_date).days + 1
+        return [
+            {
+                'date': start_date + timedelta(days=day),
+                'currency': currency,
+                'rate': round(10 + day * 0.01, 4),
+                'change': 0.01,
+                'currency_code': code
+            }
+            for day in range(days)
+        ]
+
+
+def current_rss_mb() -> float:
+    """
+    Текущий объём резидентной памяти процесса, МБ.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        # Вне Linux доступен только пиковый объём
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(func) -> tuple[float, int, object]:
+    """
+    Замер времени выполнения и количества запросов к базе данных.
+    """
+    queries = 0
+
+    def count(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+    return elapsed, queries, result
+
+
+class Command(BaseCommand):
+    """
+    Замеры производительности на синтетических данных.
+    Все изменения в базе данных откатываются после замера.
+    """
+    help = 'Замеры производительности синхронизации и расчётов.'
+
+    CURRENCIES = ['USD', 'EUR', 'GBP', 'TRY', 'JPY', 'INR', 'CNY']
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(self.scenarios()))
+        parser.add_argument(
+            '--days', type=int, default=730,
+            help='Количество дней данных на одну валюту.'
+        )
+        parser.add_argument(
+            '--currencies', type=int, default=len(self.CURRENCIES),
+            help='Количество валют.'
+        )
+        parser.add_argument(
+            '--iterations', type=int, default=2000,
+            help='Количество повторений (для нагрузочных сценариев).'
+        )
+        parser.add_argument(
+            '--fixture', action='append', default=[],
+            help='Сохранённая страница архива finmarket.ru (можно несколько).'
+        )
+        parser.add_argument(
+            '--threads', type=int, default=8,
+            help='Количество потоков (для нагрузочных сценариев).'
+        )
+
+    @classmethod
+    def scenarios(cls) -> dict:
+        return {
+            name[len('bench_'):]: getattr(cls, name)
+            for name in dir(cls) if name.startswith('bench_')
+        }
+
+    def currencies(self, count: int) -> list[str]:
+        names = list(self.CURRENCIES)
+        names += [f'X{index:02d}' for index in range(count - len(names))]
+        return names[:count]
+
+    def report(self, label: str, elapsed: float, queries: int, extra=''):
+        self.stdout.write(
+            f'{label:<32} {elapsed * 1000:>10.1f} ms {queries:>8} запросов'
+            f' {extra}'
+        )
+
+    def handle(self, *args, **options):
+        scenario = self.scenarios()[options['scenario']]
+        try:
+            # Журнал запросов режима DEBUG искажает замеры времени и памяти
+            with override_settings(DEBUG=False), transaction.atomic():
+                scenario(self, **options)
+                raise Rollback
+        except Rollback:
+            pass
+        except Exception as error:
+            raise CommandError(error) from error
+
+    def bench_upsert(self, days, currencies, **options):
+        """
+        Построчный update_or_create против пакетной синхронизации.
+        """
+        data = generate_rates(days, self.currencies(currencies))
+        changed = generate_rates(days, self.currencies(currencies), shift=1)
+        self.stdout.write(f'Строк: {len(data)}')
+
+        def legacy(rows):
+            for entry in rows:
+                CurrencyRate.objects.update_or_create(
+                    date=entry['date'],
+                    currency=entry['currency'],
+                    defaults={
+                        'rate': entry['rate'],
+                        'change': entry['change'],
+                        'currency_code': entry['currency_code']
+                    }
+                )
+
+        with transaction.atomic():
+            for label, rows in (
+                    ('вставка', data),
+                    ('без изменений', data),
+                    ('обновление', changed)):
+                elapsed, queries, _ = measure(lambda: legacy(rows))
+                self.report(f'update_or_create: {label}', elapsed, queries)
+            transaction.set_rollback(True)
+
+        for label, rows in (
+                ('вставка', data),
+                ('без изменений', data),
+                ('обновление', changed)):
+            elapsed, queries, result = measure(
+                lambda: CurrencyRate.synchronize_currency_rates(rows)
+            )
+            self.report(f'bulk_upsert: {label}', elapsed, queries, result)
+
+    def bench_relative_changes(self, days, currencies, **options):
+        """
+        Построчный расчёт относительных изменений против векторного.
+        Для замера на 100k+ строк: --days 14600 (40 лет x 7 валют).
+        """
+        CurrencyRate.synchronize_currency_rates(
+            generate_rates(days, self.currencies(currencies))
+        )
+        base_date = date(2014, 1, 1)
+        self.stdout.write(f'Строк: {CurrencyRate.objects.count()}')
+
+        def legacy():
+            relative_changes = []
+            for base_rate in CurrencyRate.objects.filter(date=base_date):
+                currency = base_rate.currency
+                rates = CurrencyRate.objects.filter(currency=currency)
+                for rate in rates:
+                    relative_changes.append({
+                        'date': rate.date,
+                        'currency': currency,
+                        'relative_change': (
+                            (rate.rate - base_rate.rate) / base_rate.rate * 100
+                        )
+                    })
+            return relative_changes
+
+        calculator = RelativeChangeCalculator(base_date)
+        elapsed, queries, expected = measure(legacy)
+        self.report('построчный расчёт', elapsed, queries)
+        elapsed, queries, actual = measure(
+            calculator.calculate_relative_changes
+        )
+        self.report('векторный расчёт', elapsed, queries)
+
+        quantum = Decimal('0.0001')
+        expected = {
+            (row['date'], row['currency']): row['relative_change'].quantize(quantum)
+            for row in expected
+        }
+        actual = {
+            (row['date'], row['currency']): row['relative_change']
+            for row in actual
+        }
+        mismatches = sum(
+            1 for key, value in expected.items() if actual.get(key) != value
+        )
+        self.stdout.write(f'Расхождений с Decimal: {mismatches}')
+
+    def bench_render(self, days, currencies, iterations, threads, **options):
+        """
+        Нагрузочный тест построения графиков из нескольких потоков.
+        Объём памяти процесса должен оставаться ровным.
+        """
+        start = date(2014, 1, 1)
+        series = {
+            currency: (
+                [start + timedelta(days=day) for day in range(days)],
+                [index + day * 0.01 for day in range(days)]
+            )
+            for index, currency in enumerate(self.currencies(currencies))
+        }
+        step = max(iterations // 10, 1)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for done in range(0, iterations, step):
+                batch = min(step, iterations - done)
+                list(executor.map(
+                    render_relative_changes, [series] * batch
+                ))
+                self.stdout.write(
+                    f'{done + batch:>8} графиков'
+                    f' {current_rss_mb():>10.1f} МБ'
+                )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{iterations / elapsed:.1f} графиков/с в {threads} потоках'
+        )
+
+    def bench_indexes(self, days, currencies, iterations, **options):
+        """
+        Время основных запросов и их планы с индексами по (currency, date)
+        и CountryCurrency.currency_code и без них (индексы удаляются
+        внутри транзакции и восстанавливаются откатом).
+        Для реалистичного объёма: --days 3650 --currencies 30.
+        """
+        names = self.currencies(currencies)
+        rates = generate_rates(days, names)
+        CurrencyRate.synchronize_currency_rates(rates)
+        RelativeChange.synchronize_relative_changes([
+            {
+                'date': row['date'],
+                'currency': row['currency'],
+                'relative_change': row['rate']
+            } for row in rates
+        ])
+        CountryCurrency.synchronize_country_currencies([
+            {
+                'country': f'Страна {index}',
+                'currency_name': name,
+                'currency_code': name,
+                'currency_number': index
+            } for index, name in enumerate(names + ['AAA', 'BBB'] * 100)
+        ])
+        self.stdout.write(f'Строк курсов: {len(rates)}')
+        start, end = date(2015, 1, 1), date(2016, 12, 31)
+        selected = names[:3]
+        queries = {
+            'курсы одной валюты': lambda: CurrencyRate.objects.filter(
+                currency=names[-1]).values_list('date', 'rate'),
+            'курсы за период': lambda: CurrencyRate.objects.filter(
+                currency__in=selected, date__range=[start, end]
+            ).values_list('currency', 'date', 'rate'),
+            'изменения за период': lambda: RelativeChange.objects.filter(
+                currency__in=selected, date__range=[start, end]
+            ).values_list('currency', 'date', 'relative_change'),
+        }
+        runs = max(iterations // 100, 1)
+
+        def run_all(title):
+            self.stdout.write(title)
+            for label, query in queries.items():
+                sql, params = query().query.sql_with_params()
+                explain = (
+                    'EXPLAIN QUERY PLAN' if connection.vendor == 'sqlite'
+                    else 'EXPLAIN'
+                )
+                # Комментарий не даёт sqlite3 взять план из кэша запросов
+                with connection.cursor() as cursor:
+                    cursor.execute(f'{explain} /* {title} */ {sql}', params)
+                    plan = ' / '.join(str(row[-1]) for row in cursor.fetchall())
+                elapsed, _, _ = measure(
+                    lambda: [list(query()) for _ in range(runs)]
+                )
+                self.report(f'  {label}', elapsed / runs, 1, plan)
+            elapsed, _, _ = measure(lambda: [
+                CurrencyTuple().load_currency_data() for _ in range(runs)
+            ])
+            self.report('  список валют (join)', elapsed / runs, 1)
+
+        run_all('С индексами:')
+        dropped = []
+        for model in (CurrencyRate, RelativeChange, CountryCurrency):
+            table = model._meta.db_table
+            with connection.cursor() as cursor:
+                constraints = connection.introspection.get_constraints(
+                    cursor, table
+                )
+            for name, info in constraints.items():
+                if info['index'] and not info['unique'] and not info['primary_key']:
+                    dropped.append(name)
+        with connection.cursor() as cursor:
+            for name in dropped:
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+        run_all(f'Без индексов ({", ".join(dropped)}):')
+
+    def bench_parse(self, days, fixture, **options):
+        """
+        Разбор страницы архива: BeautifulSoup против потокового lxml.
+        Без --fixture используется синтетическая страница на --days строк.
+        """
+        pages = {}
+        for path in fixture:
+            with open(path, 'rb') as page:
+                pages[path] = page.read()
+        if not pages:
+            pages[f'синтетическая, {days} строк'] = finmarket_page(days)
+
+        for name, content in pages.items():
+            self.stdout.write(f'{name}: {len(content) / 1024:.0f} КБ')
+            results = {}
+            for label, parse in (
+                    ('BeautifulSoup', legacy_parse),
+                    ('lxml iterparse', lambda page: list(iter_finmarket_rates(page)))):
+                elapsed, _, results[label] = measure(lambda: parse(content))
+                # Память замеряется отдельным прогоном: tracemalloc
+                # замедляет разбор в несколько раз.
+                tracemalloc.start()
+                parse(content)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                self.report(
+                    f'  {label}', elapsed, 0,
+                    f'пик памяти {peak / 2 ** 20:.1f} МБ'
+                )
+            first, second = results.values()
+            self.stdout.write(
+                f'  Строк: {len(second)}, совпадают: {first == second}'
+            )
+
+    def bench_pipeline(self, days, currencies, **options):
+        """
+        Пиковая память и время синхронизации курсов: загрузка всех
+        строк в список против потоковой записи пакетами.
+        Замер повторяется для периода в 1 и 4 раза длиннее --days.
+        """
+        names = self.currencies(currencies)
+        start = date(2000, 1, 1)
+
+        def collect(fetcher):
+            return CurrencyRate.synchronize_currency_rates(
+                fetcher.fetch_currency_rates()
+            )
+
+        def stream(fetcher):
+            result = UpsertResult()
+            for batch in fetcher.iter_currency_rate_batches():
+                result += CurrencyRate.synchronize_currency_rates(batch)
+            return result
+
+        for length in (days, days * 4):
+            end = start + timedelta(days=length - 1)
+            self.stdout.write(f'{length} дней x {len(names)} валют:')
+            for label, run in (('список', collect), ('поток', stream)):
+                with transaction.atomic():
+                    fetcher = SyntheticFetcher(start, end, names)
+                    tracemalloc.start()
+                    elapsed, queries, result = measure(lambda: run(fetcher))
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    self.report(
+                        f'  {label}', elapsed, queries,
+                        f'пик памяти {peak / 2 ** 20:.1f} МБ, {result.total} строк'
+                    )
+                    transaction.set_rollback(True)
+
+    def bench_choices(self, days, currencies, iterations, **options):
+        """
+        Открытие страницы relative_changes: без кэша списка валют
+        (холодный запуск) и с кэшем (повторные запросы).
+        """
+        names = self.currencies(currencies)
+        CurrencyRate.synchronize_currency_rates(generate_rates(days, names))
+        CountryCurrency.synchronize_country_currencies([
+            {
+                'country': f'Страна {index}',
+                'currency_name': name,
+                'currency_code': name,
+                'currency_number': index
+            } for index, name in enumerate(names)
+        ])
+        self.stdout.write(f'Строк курсов: {CurrencyRate.objects.count()}')
+        client = Client()
+        runs = max(iterations // 100, 1)
+
+        def cold():
+            for _ in range(runs):
+                cache.clear()
+                CurrencyTuple._process_cache = (None, [])
+                client.get('/relative-changes/')
+
+        def warm():
+            for _ in range(runs):
+                client.get('/relative-changes/')
+
+        def legacy_join():
+            for _ in range(runs):
+                list(CountryCurrency.objects.raw(
+                    'SELECT DISTINCT '
+                    'cac.id, cac.country, cac.currency_code, cac.currency_name '
+                    'from currency_app_countrycurrency cac '
+                    'join currency_app_currencyrate cac2 '
+                    'on cac.currency_code = cac2.currency '
+                    'order by cac.currency_name'
+                ))
+
+        def exists_query():
+            for _ in range(runs):
+                CurrencyTuple().load_currency_data()
+
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for label, run in (
+                    ('прежний запрос DISTINCT join', legacy_join),
+                    ('запрос EXISTS', exists_query),
+                    ('страница, холодный кэш', cold),
+                    ('страница, тёплый кэш', warm)):
+                elapsed, queries, _ = measure(run)
+                self.report(label, elapsed / runs, queries // runs)
+
+    def bench_rollups(self, days, currencies, **options):
+        """
+        Построение агрегатов и чтение длинного ряда по дням
+        против недельных и месячных агрегатов.
+        Для замера на длинном периоде: --days 7300 (20 лет).
+        """
+        names = tuple(self.currencies(currencies))
+        CurrencyRate.synchronize_currency_rates(generate_rates(days, list(names)))
+        start = date(2014, 1, 1)
+        end = start + timedelta(days=days - 1)
+        self.stdout.write(f'Строк: {CurrencyRate.objects.count()}')
+
+        elapsed, queries, result = measure(refresh_rollups)
+        self.report('полный пересчёт агрегатов', elapsed, queries, result)
+        CurrencyRate.synchronize_currency_rates(
+            generate_rates(days, list(names), shift=1)[-30:]
+        )
+        elapsed, queries, result = measure(
+            lambda: refresh_rollups(names, end - timedelta(days=29), end)
+        )
+        self.report('пересчёт за 30 дней', elapsed, queries, result)
+
+        elapsed, queries, series = measure(
+            lambda: relative_change_series.__wrapped__(start, names, start, end)
+        )
+        points = sum(len(dates) for dates, _ in series.values())
+        self.report('ряд по дням', elapsed, queries, f'{points} точек')
+        for period in ('week', 'month'):
+            elapsed, queries, series = measure(
+                lambda: rollup_relative_change_series.__wrapped__(
+                    period, start, names, start, end
+                )
+            )
+            points = sum(len(dates) for dates, _ in series.values())
+            self.report(f'ряд по агрегатам ({period})', elapsed, queries,
+                        f'{points} точек')
+
+    def bench_asgi(self, days, currencies, iterations, threads, **options):
+        """
+        Нагрузочный тест одного ASGI-процесса: threads запросов
+        с построением графика (каждый со своей базовой датой, мимо кэша)
+        и одновременно iterations лёгких запросов страницы.
+        Синхронные представления под ASGI выполняются по очереди в одном
+        потоке, поэтому лёгкие запросы ждут графиков; асинхронные
+        отвечают, пока графики строятся в пуле процессов.
+        Пример: --iterations 50 --threads 8.
+        """
+        names = self.currencies(currencies)
+        CurrencyRate.synchronize_currency_rates(generate_rates(days, names))
+        CountryCurrency.synchronize_country_currencies([
+            {
+                'country': f'Страна {index}',
+                'currency_name': name,
+                'currency_code': name,
+                'currency_number': index
+            } for index, name in enumerate(names)
+        ])
+        refresh_rollups()
+        start = date(2014, 1, 1)
+        end = start + timedelta(days=min(days, 730) - 1)
+
+        async def timed(request):
+            started = time.perf_counter()
+            response = await request
+            if response.status_code != 200:
+                raise CommandError(f'Ответ {response.status_code}')
+            return time.perf_counter() - started
+
+        async def load(prefix):
+            client = AsyncClient()
+            charts = [
+                timed(client.post(f'{prefix}relative-changes/', {
+                    'start_date': start.isoformat(),
+                    'end_date': end.isoformat(),
+                    'base_date': (start + timedelta(days=index)).isoformat(),
+                    'currency': names
+                }))
+                for index in range(threads)
+            ]
+            pages = [
+                timed(client.get(f'{prefix}relative-changes/'))
+                for _ in range(iterations)
+            ]
+            started = time.perf_counter()
+            results = await asyncio.gather(*charts, *pages)
+            return time.perf_counter() - started, results[threads:]
+
+        # Запуск пула процессов не входит в замер
+        async_to_sync(render_relative_changes_async)({'USD': ([start], [0.0])})
+        self.stdout.write(
+            f'Строк: {CurrencyRate.objects.count()}, графиков: {threads}, '
+            f'лёгких запросов: {iterations}'
+        )
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for label, prefix in (
+                    ('синхронные представления', '/'),
+                    ('асинхронные представления', '/async/')):
+                get_chart_cache().clear()
+                relative_change_series.cache_clear()
+                rollup_relative_change_series.cache_clear()
+                elapsed, queries, (total, pages) = measure(
+                    lambda: async_to_sync(load)(prefix)
+                )
+                pages.sort()
+                self.report(
+                    label, total, queries,
+                    f'страница: медиана {statistics.median(pages) * 1000:.0f} мс,'
+                    f' p95 {pages[int(len(pages) * 0.95) - 1] * 1000:.0f} мс'
+                )
+
+    def bench_many_currencies(self, days, currencies, threads, **options):
+        """
+        Синхронизация курсов по большому числу валют (реестр источника
+        содержит 100+ валют): пропускная способность при разном числе
+        потоков и ограничении частоты запросов к хосту.
+        Пример: --currencies 150 --days 30.
+        """
+        names = self.currencies(currencies)
+        start = date(2014, 1, 1)
+        end = start + timedelta(days=days - 1)
+        self.stdout.write(
+            f'{len(names)} валют x {days} дней, '
+            f'задержка ответа {SyntheticFetcher.DELAY * 1000:.0f} мс'
+        )
+        for workers, per_host, rate in (
+                (CurrencyFetcher.MAX_WORKERS, CurrencyFetcher.PER_HOST_LIMIT,
+                 CurrencyFetcher.RATE_LIMIT),
+                (threads, threads, CurrencyFetcher.RATE_LIMIT),
+                (threads, threads, 0)):
+            with transaction.atomic():
+                fetcher = SyntheticFetcher(
+                    start, end, names, max_workers=workers,
+                    per_host_limit=per_host, rate_limit=rate
+                )
+                requests_count = len(fetcher.tasks())
+
+                def run():
+                    result = UpsertResult()
+                    for batch in fetcher.iter_currency_rate_batches():
+                        result += CurrencyRate.synchronize_currency_rates(batch)
+                    return result
+
+                elapsed, queries, result = measure(run)
+                self.report(
+                    f'{workers} потоков, {per_host} к хосту, '
+                    + (f'{rate} запр/с' if rate else 'без лимита'),
+                    elapsed, queries,
+                    f'{requests_count / elapsed:.1f} запросов/с, '
+                    f'{result.total / elapsed:.0f} строк/с'
+                )
+                transaction.set_rollback(True)
+
+    def bench_rate_store(self, days, currencies, iterations, **options):
+        """
+        Загрузка RateStore, объём памяти на миллион строк, срез ряда
+        двоичным поиском и дочитывание изменений по upload_time.
+        Для замера на ~1 млн строк: --days 14600 --currencies 70.
+        """
+        names = self.currencies(currencies)
+        CurrencyRate.synchronize_currency_rates(generate_rates(days, names))
+        rows = CurrencyRate.objects.count()
+        self.stdout.write(f'Строк: {rows}')
+        store = get_rate_store()
+        start = date(2014, 1, 1)
+        end = start + timedelta(days=min(days, 730) - 1)
+
+        def orm_series():
+            return list(
+                CurrencyRate.objects.filter(
+                    date__range=[start, end], currency__in=names
+                ).values_list('currency', 'date', 'rate')
+            )
+
+        elapsed, queries, _ = measure(orm_series)
+        self.report('ORM: ряд за 2 года (Decimal)', elapsed, queries)
+
+        store.reset()
+        elapsed, queries, _ = measure(store.currencies)
+        store.reset()
+        tracemalloc.start()
+        store.currencies()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.report(
+            'полная загрузка', elapsed, queries,
+            f'{store.nbytes / 2 ** 20:.1f} МБ массивов, '
+            f'{store.nbytes / rows * 1e6 / 2 ** 20:.1f} МБ на 1 млн строк, '
+            f'пик при загрузке {peak / 2 ** 20:.1f} МБ'
+        )
+
+        elapsed, queries, _ = measure(
+            lambda: [store.slice(names[0], start, end) for _ in range(iterations)]
+        )
+        self.report(
+            'срез за 2 года', elapsed / iterations, queries,
+            f'{elapsed / iterations * 1e6:.1f} мкс'
+        )
+        elapsed, queries, _ = measure(
+            lambda: [
+                relative_change_series.__wrapped__(start, tuple(names), start, end)
+                for _ in range(10)
+            ]
+        )
+        self.report('relative_change_series', elapsed / 10, queries)
+
+        changed = generate_rates(days, names, shift=1)[-30:]
+        CurrencyRate.synchronize_currency_rates(changed)
+        bump_data_version()
+        elapsed, queries, _ = measure(store.ensure_fresh)
+        dates, rates = store.slice(changed[-1]['currency'])
+        self.report(
+            'дочитывание 30 изменений', elapsed, queries,
+            f'последний курс {rates[-1] / 10 ** 4} '
+            f'(ожидается {changed[-1]["rate"]}), строк {store.rows}'
+        )
+
+    def bench_calendar(self, days, currencies, iterations, **options):
+        """
+        Курс на произвольные даты (в том числе выходные): запрос
+        последнего курса на каждую дату против векторного поиска
+        по торговому календарю и переноса последнего курса.
+        """
+        names = self.currencies(currencies)
+        CurrencyRate.synchronize_currency_rates([
+            row for row in generate_rates(days, names)
+            if row['date'].weekday() < 5
+        ])
+        store = get_rate_store()
+        store.reset()
+        start = date(2014, 1, 1)
+        targets = [start + timedelta(days=day) for day in range(days)]
+        self.stdout.write(
+            f'Строк: {CurrencyRate.objects.count()}, дат: {len(targets)}'
+        )
+
+        def per_date():
+            return [
+                CurrencyRate.objects.filter(currency=names[0], date__lte=value)
+                .order_by('-date').values_list('rate', flat=True).first()
+                for value in targets
+            ]
+
+        def vectorized():
+            days_array = np.array(targets, dtype='datetime64[D]')
+            store.calendar().as_of(days_array)
+            return forward_fill(*store.slice(names[0]), days_array)
+
+        elapsed, queries, expected = measure(per_date)
+        self.report('запрос на каждую дату', elapsed, queries)
+        store.currencies()
+        elapsed, queries, (rates, known) = measure(vectorized)
+        self.report('календарь и перенос курса', elapsed, queries)
+        mismatches = sum(
+            1 for value, rate, is_known in zip(expected, rates, known)
+            if value is not None and (not is_known or int(value * 10 ** 4) != rate)
+        )
+        self.stdout.write(f'Расхождений: {mismatches}')
+
+    def bench_cross_rates(self, days, currencies, **options):
+        """
+        Кросс-курсы всех пар валют за период: чтение обеих валют
+        из базы и деление по датам в Python против векторного расчёта
+        по RateStore (без кэша и из кэша).
+        """
+        names = self.currencies(currencies)
+        CurrencyRate.synchronize_currency_rates(generate_rates(days, names))
+        get_rate_store().reset()
+        pairs = tuple(
+            (base, quote) for base in names for quote in names if base != quote
+        )
+        start = date(2014, 1, 1)
+        end = start + timedelta(days=days - 1)
+        self.stdout.write(f'Пар: {len(pairs)}, дней: {days}')
+
+        def legacy():
+            series = {}
+            for base, quote in pairs:
+                rates = {
+                    currency: dict(
+                        CurrencyRate.objects.filter(
+                            currency=currency, date__range=[start, end]
+                        ).values_list('date', 'rate')
+                    )
+                    for currency in (base, quote)
+                }
+                series[f'{base}/{quote}'] = [
+                    (day, rate / rates[quote][day])
+                    for day, rate in sorted(rates[base].items())
+                    if rates[quote].get(day)
+                ]
+            return series
+
+        elapsed, queries, _ = measure(legacy)
+        self.report('ORM и деление по датам', elapsed, queries)
+        get_rate_store().currencies()
+        elapsed, queries, _ = measure(
+            lambda: cross_rate_series.__wrapped__(pairs, start, end)
+        )
+        self.report('векторный расчёт', elapsed, queries)
+        cross_rate_series(pairs, start, end)
+        elapsed, queries, _ = measure(
+            lambda: cross_rate_series(pairs, start, end)
+        )
+        self.report('из кэша', elapsed, queries)
+
+    def bench_export(self, days, currencies, **options):
+        """
+        Выгрузка курсов: весь набор в память (list + DataFrame.to_csv)
+        против потоковой выгрузки CSV и Parquet по частям.
+        Для замера на ~1 млн строк: --days 14600 --currencies 70.
+        """
+        names = self.currencies(currencies)
+        CurrencyRate.synchronize_currency_rates(generate_rates(days, names))
+        self.stdout.write(f'Строк: {CurrencyRate.objects.count()}')
+
+        def materialized():
+            rows = list(
+                CurrencyRate.objects.order_by('currency', 'date').values_list(
+                    'date', 'currency', 'rate', 'change', 'currency_code'
+                )
+            )
+            frame = pd.DataFrame(rows, columns=[
+                'date', 'currency', 'rate', 'change', 'currency_code'
+            ])
+            return len(frame.to_csv(index=False))
+
+        def streamed(iterate):
+            return sum(
+                len(part) for part in iterate('rates', export_rows('rates'))
+            )
+
+        scenarios = [
+            ('весь набор в памяти, CSV', materialized),
+            ('поток, CSV', lambda: streamed(iter_csv)),
+        ]
+        if parquet_available():
+            scenarios.append(('поток, Parquet', lambda: streamed(iter_parquet)))
+        else:
+            self.stdout.write('pyarrow не установлен, Parquet пропущен')
+        for label, run in scenarios:
+            elapsed, queries, size = measure(run)
+            tracemalloc.start()
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.report(
+                label, elapsed, queries,
+                f'{size / 2 ** 20:.1f} МБ ответа, пик памяти {peak / 2 ** 20:.1f} МБ'
+            )
@@ -0,0 +1,29 @@
+import time
+from datetime import date
+from django.core.management.base import BaseCommand
+from currency_app.rollups import refresh_rollups
+
+
+class Command(BaseCommand):
+    """
+    Построение недельных и месячных агрегатов (CurrencyRateRollup)
+    по уже загруженным курсам. Нужна один раз после миграции:
+    дальше агрегаты обновляет синхронизация.
+    """
+    help = 'Пересчёт недельных и месячных агрегатов курсов валют.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', type=date.fromisoformat,
+                            help='Начало периода, ГГГГ-ММ-ДД.')
+        parser.add_argument('--end-date', type=date.fromisoformat,
+                            help='Конец периода, ГГГГ-ММ-ДД.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        result = refresh_rollups(
+            start_date=options['start_date'], end_date=options['end_date']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Агрегаты пересчитаны за {time.perf_counter() - started:.1f} с: '
+            f'{result}'
+        ))
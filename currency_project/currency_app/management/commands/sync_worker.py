@@ -0,0 +1,88 @@
+import threading
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from currency_app.metrics import start_metrics_server
+from currency_app.models import SyncJob
+from currency_app.sync import run_job
+
+
+class Command(BaseCommand):
+    """
+    Обработчик очереди задач синхронизации (SyncJob).
+    Запускается отдельным процессом рядом с веб-сервером.
+    Задачи, оставшиеся в статусе RUNNING после остановки обработчика,
+    выполняются заново по истечении SyncJob.STALE_AFTER.
+    С --metrics-port метрики этапов синхронизации (fetch, parse,
+    upsert_*, sync_*) отдаются в формате Prometheus на этом порту.
+    """
+    help = 'Выполнение задач синхронизации из очереди.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads', type=int, default=1,
+            help='Количество потоков-обработчиков.'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=2.0,
+            help='Пауза между проверками пустой очереди, с.'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить задачи, имеющиеся в очереди, и завершиться.'
+        )
+        parser.add_argument(
+            '--metrics-port', type=int,
+            help='Порт HTTP-сервера метрик Prometheus (по умолчанию выключен).'
+        )
+        parser.add_argument(
+            '--metrics-address', default='127.0.0.1',
+            help='Адрес HTTP-сервера метрик.'
+        )
+
+    def handle(self, *args, **options):
+        if options['metrics_port'] is not None:
+            server = start_metrics_server(
+                options['metrics_port'], options['metrics_address']
+            )
+            self.stdout.write(
+                f'Метрики: http://{options["metrics_address"]}:'
+                f'{server.server_port}/metrics'
+            )
+        threads = [
+            threading.Thread(
+                target=self.work,
+                args=(options['poll_interval'], options['once']),
+                daemon=True
+            )
+            for _ in range(options['threads'])
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            self.stdout.write('Остановка обработчика.')
+
+    def work(self, poll_interval: float, once: bool):
+        while True:
+            close_old_connections()
+            job = SyncJob.claim_next()
+            if job is None:
+                if once:
+                    break
+                time.sleep(poll_interval)
+                continue
+            self.stdout.write(
+                f'Задача №{job.pk}: {job.start_date} - {job.end_date}'
+            )
+            try:
+                run_job(job)
+            except Exception as error:
+                self.stderr.write(f'Задача №{job.pk} завершилась с ошибкой: {error}')
+            else:
+                self.stdout.write(
+                    f'Задача №{job.pk} выполнена за {job.duration} с'
+                )
+        close_old_connections()
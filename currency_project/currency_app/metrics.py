@@ -0,0 +1,305 @@
+import cProfile
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+
+
+# Границы корзин гистограмм длительности, секунды
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Счётчики запросов к базе для открытых замеров текущего контекста.
+# Контекст переходит в потоки sync_to_async, поэтому запросы ORM
+# из асинхронных представлений тоже учитываются.
+_query_counters: ContextVar[tuple] = ContextVar(
+    'currency_app_query_counters', default=()
+)
+
+
+class Metric:
+    """
+    Метрика в формате Prometheus со значениями по набору меток.
+    """
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def label_text(self, values: tuple, **extra) -> str:
+        pairs = [*zip(self.labels, values), *extra.items()]
+        escaped = (
+            (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+            for name, value in pairs
+        )
+        return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+    def render(self) -> list[str]:
+        lines = [
+            f'# HELP {self.name} {self.help_text}',
+            f'# TYPE {self.name} {self.kind}'
+        ]
+        with self.lock:
+            values = sorted(self.values.items())
+        for labels, value in values:
+            lines.extend(self.render_value(labels, value))
+        return lines
+
+    def render_value(self, labels: tuple, value) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, labels: tuple, amount: float = 1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render_value(self, labels: tuple, value) -> list[str]:
+        return [f'{self.name}{self.label_text(labels)} {value}']
+
+
+class Histogram(Metric):
+    """
+    Гистограмма: количество наблюдений по корзинам BUCKETS и их сумма.
+    """
+    kind = 'histogram'
+
+    def observe(self, labels: tuple, value: float):
+        with self.lock:
+            counts, total = self.values.get(
+                labels, ((0,) * (len(BUCKETS) + 1), 0.0)
+            )
+            index = bisect_left(BUCKETS, value)
+            counts = counts[:index] + (counts[index] + 1,) + counts[index + 1:]
+            self.values[labels] = (counts, total + value)
+
+    def render_value(self, labels: tuple, value) -> list[str]:
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*BUCKETS, '+Inf'), counts):
+            cumulative += count
+            lines.append(
+                f'{self.name}_bucket{self.label_text(labels, le=bound)} '
+                f'{cumulative}'
+            )
+        lines.append(f'{self.name}_sum{self.label_text(labels)} {total:.6f}')
+        lines.append(f'{self.name}_count{self.label_text(labels)} {cumulative}')
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    'currency_app_stage_seconds',
+    'Длительность этапов обработки, с.',
+    ('stage',)
+)
+STAGE_QUERIES = Counter(
+    'currency_app_stage_queries_total',
+    'Запросы к базе данных, выполненные на этапе.',
+    ('stage',)
+)
+REQUEST_SECONDS = Histogram(
+    'currency_app_request_seconds',
+    'Длительность обработки HTTP-запросов, с.',
+    ('view', 'method')
+)
+REQUEST_QUERIES = Counter(
+    'currency_app_request_queries_total',
+    'Запросы к базе данных, выполненные при обработке HTTP-запросов.',
+    ('view', 'method')
+)
+REQUESTS = Counter(
+    'currency_app_requests_total',
+    'Обработанные HTTP-запросы.',
+    ('view', 'method', 'status')
+)
+METRICS = (STAGE_SECONDS, STAGE_QUERIES, REQUEST_SECONDS, REQUEST_QUERIES, REQUESTS)
+
+
+def count_queries(execute, sql, params, many, context):
+    """
+    Обёртка выполнения запросов (connection.execute_wrapper): увеличивает
+    счётчики всех открытых замеров текущего контекста.
+    """
+    for counter in _query_counters.get():
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """
+    Обработчик сигнала connection_created: подключение count_queries
+    к каждому новому соединению с базой.
+    """
+    # В начало списка: connection.execute_wrapper() снимает последнюю
+    # обёртку при выходе из блока
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_queries)
+
+
+@contextmanager
+def track_queries():
+    """
+    Подсчёт запросов к базе внутри блока; счётчик - список из одного числа.
+    """
+    counter = [0]
+    # Соединение могло быть открыто до подключения обработчика сигнала
+    install_query_counter(None, connection)
+    token = _query_counters.set((*_query_counters.get(), counter))
+    try:
+        yield counter
+    finally:
+        _query_counters.reset(token)
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Замер этапа: длительность попадает в гистограмму STAGE_SECONDS,
+    количество запросов к базе - в STAGE_QUERIES.
+    """
+    started = time.perf_counter()
+    with track_queries() as queries:
+        try:
+            yield
+        finally:
+            STAGE_SECONDS.observe((stage,), time.perf_counter() - started)
+            STAGE_QUERIES.inc((stage,), queries[0])
+
+
+def timed(stage: str):
+    """
+    Декоратор: замер каждого вызова функции как этапа stage.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Метрики процесса в текстовом формате Prometheus.
+    Каждый процесс сервера отдаёт свои значения.
+    """
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        content = render_metrics().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(port: int, address: str = '') -> ThreadingHTTPServer:
+    """
+    HTTP-сервер метрик в отдельном потоке для процессов без веб-сервера
+    (sync_worker): этапы загрузки, разбора, записи и расчёта
+    выполняются там и в /metrics/ веб-процесса не попадают.
+    Метрики отдаются по любому пути.
+    """
+    server = ThreadingHTTPServer((address, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name='metrics-server', daemon=True
+    ).start()
+    return server
+
+
+class MetricsMiddleware:
+    """
+    Замер длительности и количества запросов к базе для каждого
+    HTTP-запроса по имени представления. Доля запросов
+    PROFILE_SAMPLE_RATE (0 - выключено) выполняется под cProfile,
+    профиль сохраняется в PROFILE_DIR и открывается, например,
+    через python -m pstats или snakeviz.
+    Работает как с синхронными, так и с асинхронными представлениями.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+        self.profile_dir = Path(getattr(
+            settings, 'PROFILE_DIR', Path(settings.BASE_DIR) / 'profiles'
+        ))
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profiler = self.start_profiler()
+        started = time.perf_counter()
+        with track_queries() as queries:
+            response = self.get_response(request)
+        self.record(request, response, started, queries[0], profiler)
+        return response
+
+    async def __acall__(self, request):
+        profiler = self.start_profiler()
+        started = time.perf_counter()
+        with track_queries() as queries:
+            response = await self.get_response(request)
+        self.record(request, response, started, queries[0], profiler)
+        return response
+
+    def start_profiler(self) -> cProfile.Profile | None:
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # В этом потоке уже работает другой профилировщик
+            return None
+        return profiler
+
+    def record(self, request, response, started, queries, profiler):
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.url_name if match is not None else 'unmatched'
+        labels = (view, request.method)
+        REQUEST_SECONDS.observe(labels, elapsed)
+        REQUEST_QUERIES.inc(labels, queries)
+        REQUESTS.inc((*labels, response.status_code))
+        if profiler is not None:
+            profiler.disable()
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(
+                self.profile_dir
+                / f'{view}-{time.strftime("%Y%m%d-%H%M%S")}-{elapsed * 1000:.0f}ms.prof'
+            )
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.13 on 2026-10-18 13:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('currency_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='countrycurrency',
+            name='currency_code',
+            field=models.CharField(db_index=True, max_length=4),
+        ),
+        migrations.AddIndex(
+            model_name='currencyrate',
+            index=models.Index(fields=['currency', 'date'], name='currencyrate_currency_date'),
+        ),
+        migrations.AddIndex(
+            model_name='relativechange',
+            index=models.Index(fields=['currency', 'date'], name='relativechange_currency_date'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.13 on 2026-10-18 13:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('currency_app', '0003_syncjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrencyRateRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Неделя'), ('month', 'Месяц')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('currency', models.CharField(max_length=50)),
+                ('open_rate', models.DecimalField(decimal_places=4, max_digits=10)),
+                ('high_rate', models.DecimalField(decimal_places=4, max_digits=10)),
+                ('low_rate', models.DecimalField(decimal_places=4, max_digits=10)),
+                ('close_rate', models.DecimalField(decimal_places=4, max_digits=10)),
+                ('mean_rate', models.DecimalField(decimal_places=4, max_digits=10)),
+                ('days', models.IntegerField()),
+                ('upload_time', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('period', 'currency', 'period_start')},
+            },
+        ),
+    ]
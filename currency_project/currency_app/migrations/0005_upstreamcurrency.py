@@ -0,0 +1,45 @@
+# Generated by Django 4.2.13 on 2026-10-18 13:21
+
+from django.db import migrations, models
+
+
+# Идентификаторы, которые раньше были заданы в CurrencyFetcher.CURRENCY_CODES
+INITIAL_CURRENCIES = {
+    'USD': 52148,
+    'EUR': 52170,
+    'GBP': 52146,
+    'TRY': 52158,
+    'JPY': 52246,
+    'INR': 52238,
+    'CNY': 52207
+}
+
+
+def seed_currencies(apps, schema_editor):
+    UpstreamCurrency = apps.get_model('currency_app', 'UpstreamCurrency')
+    UpstreamCurrency.objects.bulk_create([
+        UpstreamCurrency(currency_code=code, upstream_id=upstream_id)
+        for code, upstream_id in INITIAL_CURRENCIES.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('currency_app', '0004_currencyraterollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UpstreamCurrency',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency_code', models.CharField(max_length=4, unique=True)),
+                ('upstream_id', models.IntegerField()),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('active', models.BooleanField(default=True)),
+                ('upload_time', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(seed_currencies, migrations.RunPython.noop),
+    ]
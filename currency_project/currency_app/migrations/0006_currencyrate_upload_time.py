@@ -0,0 +1,18 @@
+# Generated by Django 4.2.13 on 2026-10-18 13:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('currency_app', '0005_upstreamcurrency'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='currencyrate',
+            name='upload_time',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.13 on 2026-10-18 13:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('currency_app', '0006_currencyrate_upload_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FetchedPeriod',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=50)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('fetched_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['currency', 'start_date'], name='fetchedperiod_currency_start')],
+            },
+        ),
+    ]
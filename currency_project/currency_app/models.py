@@ -1,4 +1,53 @@
+import time
+from datetime import timedelta
 from django.db import models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .bulk import UpsertResult, bulk_upsert
+from .metrics import timed
+
+
+class DataVersion(models.Model):
+    """
+    Версия данных (одна строка). Увеличивается в той же транзакции,
+    что и запись в таблицы курсов, поэтому новое значение видят все
+    процессы (веб-сервер и sync_worker) сразу после фиксации записи.
+    Прочитанное значение хранится в памяти процесса не дольше
+    CACHE_SECONDS, чтобы частые проверки версии не шли в базу.
+    version: BigInteger - Номер версии.
+    """
+    CACHE_SECONDS = 1.0
+    _process_cache = (None, 0.0)
+
+    version = models.BigIntegerField(default=1)
+
+    @classmethod
+    def current(cls) -> int:
+        version, expires = cls._process_cache
+        if version is not None and time.monotonic() < expires:
+            return version
+        version = (
+            cls.objects.filter(pk=1).values_list('version', flat=True).first()
+            or 1
+        )
+        cls._process_cache = (version, time.monotonic() + cls.CACHE_SECONDS)
+        return version
+
+    @classmethod
+    def forget(cls):
+        cls._process_cache = (None, 0.0)
+
+    @classmethod
+    def bump(cls):
+        """
+        Увеличение версии; вызывается внутри записывающей транзакции.
+        Значение в памяти процесса сбрасывается сразу и ещё раз после
+        фиксации, чтобы другие потоки не сохранили старую версию.
+        """
+        if not cls.objects.filter(pk=1).update(version=F('version') + 1):
+            cls.objects.get_or_create(pk=1, defaults={'version': 2})
+        cls.forget()
+        transaction.on_commit(cls.forget)
 
 
 class CurrencyRate(models.Model):
@@ -10,33 +59,45 @@ class CurrencyRate(models.Model):
     currency - Название валюты.
     rate - Курс обмена на актуальную дату.
     change - Измение валюты относительно предыдущего значения.
+    upload_time - Время добавления или последнего изменения записи
+    (по нему RateStore дочитывает новые курсы).
     """
     date = models.DateField()
     currency = models.CharField(max_length=50)
     rate = models.DecimalField(max_digits=10, decimal_places=4)
     change = models.DecimalField(max_digits=10, decimal_places=4)
     currency_code = models.IntegerField()
-    upload_time = models.DateTimeField(auto_now_add=True)
+    upload_time = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         unique_together = ('date', 'currency')
+        # Уникальный индекс начинается с даты, а запросы фильтруют
+        # по валюте и периоду.
+        indexes = [
+            models.Index(
+                fields=['currency', 'date'],
+                name='currencyrate_currency_date'
+            ),
+        ]
 
     @staticmethod
+    @timed('upsert_currency_rates')
     @transaction.atomic
-    def synchronize_currency_rates(data):
+    def synchronize_currency_rates(
+            data, batch_size: int | None = None) -> UpsertResult:
         """
         Метод для добавления курсов валют в таблицу (CurrencyRate).
         """
-        for entry in data:
-            CurrencyRate.objects.update_or_create(
-                date=entry['date'],
-                currency=entry['currency'],
-                defaults={
-                    'rate': entry['rate'],
-                    'change': entry['change'],
-                    'currency_code': entry['currency_code']
-                    }
-            )
+        result = bulk_upsert(
+            CurrencyRate,
+            data,
+            unique_fields=['date', 'currency'],
+            update_fields=['rate', 'change', 'currency_code'],
+            batch_size=batch_size
+        )
+        if result.inserted or result.updated:
+            DataVersion.bump()
+        return result
 
 
 class CountryCurrency(models.Model):
@@ -50,25 +111,68 @@ class CountryCurrency(models.Model):
     """
     country = models.CharField(max_length=100)
     currency_name = models.CharField(max_length=4)
-    currency_code = models.CharField(max_length=4)
+    currency_code = models.CharField(max_length=4, db_index=True)
     currency_number = models.IntegerField()
     upload_time = models.DateTimeField(auto_now_add=True)
 
     @staticmethod
+    @timed('upsert_country_currencies')
     @transaction.atomic
-    def synchronize_country_currencies(data):
+    def synchronize_country_currencies(
+            data, batch_size: int | None = None) -> UpsertResult:
         """
         Метод для добавления списка валют в таблицу (CountryCurrency).
         """
-        for entry in data:
-            CountryCurrency.objects.update_or_create(
-                country=entry['country'],
-                defaults={
-                    'currency_name': entry['currency_name'],
-                    'currency_code': entry['currency_code'],
-                    'currency_number': entry['currency_number']
-                    }
-            )
+        result = bulk_upsert(
+            CountryCurrency,
+            data,
+            unique_fields=['country'],
+            update_fields=['currency_name', 'currency_code', 'currency_number'],
+            batch_size=batch_size
+        )
+        if result.inserted or result.updated:
+            DataVersion.bump()
+        return result
+
+
+class UpstreamCurrency(models.Model):
+    """
+    Реестр валют источника курсов (www.finmarket.ru).
+    Идентификаторы валют на finmarket.ru не совпадают с кодами ISO,
+    поэтому соответствие хранится в базе и обновляется со страницы
+    архива курсов (см. utils.CurrencyRegistryFetcher).
+    currency_code: Char - Текстовый код валюты (ISO 4217).
+    upstream_id: Integer - Идентификатор валюты на finmarket.ru.
+    name: Char - Название валюты на finmarket.ru.
+    active: Boolean - Загружать ли курсы валюты при синхронизации.
+    upload_time: DateTime - Время последнего изменения записи.
+    """
+    currency_code = models.CharField(max_length=4, unique=True)
+    upstream_id = models.IntegerField()
+    name = models.CharField(max_length=100, blank=True)
+    active = models.BooleanField(default=True)
+    upload_time = models.DateTimeField(auto_now=True)
+
+    @staticmethod
+    @timed('upsert_upstream_currencies')
+    @transaction.atomic
+    def synchronize_upstream_currencies(
+            data, batch_size: int | None = None) -> UpsertResult:
+        """
+        Метод для добавления валют источника в реестр (UpstreamCurrency).
+        Флаг active не перезаписывается: отключённые вручную валюты
+        остаются отключёнными.
+        """
+        result = bulk_upsert(
+            UpstreamCurrency,
+            data,
+            unique_fields=['currency_code'],
+            update_fields=['upstream_id', 'name'],
+            batch_size=batch_size
+        )
+        if result.inserted or result.updated:
+            DataVersion.bump()
+        return result
 
 
 class SyncParameter(models.Model):
@@ -82,6 +186,29 @@ class SyncParameter(models.Model):
     param_value = models.DateField()
 
 
+class FetchedPeriod(models.Model):
+    """
+    Периоды, курсы за которые уже загружены с www.finmarket.ru.
+    Сохраняется после записи курсов в базу (см. utils.SyncPlanner),
+    поэтому выходные и праздники внутри периода не считаются пропуском.
+    currency: Char - Валюта.
+    start_date, end_date: Date - Границы загруженного периода.
+    fetched_at: DateTime - Время загрузки.
+    """
+    currency = models.CharField(max_length=50)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    fetched_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['currency', 'start_date'],
+                name='fetchedperiod_currency_start'
+            ),
+        ]
+
+
 class RelativeChange(models.Model):
     """
     Таблица для хранения информации об изменении курсов валют.
@@ -97,18 +224,185 @@ class RelativeChange(models.Model):
 
     class Meta:
         unique_together = ('date', 'currency')
+        indexes = [
+            models.Index(
+                fields=['currency', 'date'],
+                name='relativechange_currency_date'
+            ),
+        ]
 
     @staticmethod
+    @timed('upsert_relative_changes')
     @transaction.atomic
-    def synchronize_relative_changes(data):
+    def synchronize_relative_changes(
+            data, batch_size: int | None = None) -> UpsertResult:
         """
         Метод для добавления данных в таблицу RelativeChange.
         """
-        for entry in data:
-            RelativeChange.objects.update_or_create(
-                date=entry['date'],
-                currency=entry['currency'],
-                defaults={
-                    'relative_change': entry['relative_change']
-                    }
-            )
\ No newline at end of file
+        result = bulk_upsert(
+            RelativeChange,
+            data,
+            unique_fields=['date', 'currency'],
+            update_fields=['relative_change'],
+            batch_size=batch_size
+        )
+        if result.inserted or result.updated:
+            DataVersion.bump()
+        return result
+
+
+class SyncJob(models.Model):
+    """
+    Задача фоновой синхронизации данных.
+    start_date, end_date: Date - Период синхронизации.
+    status: Char - Состояние задачи.
+    stage: Char - Выполняемый этап.
+    stages: JSON - Длительность и количество строк по этапам.
+    error: Text - Текст ошибки, если задача завершилась неудачно.
+    heartbeat_at: DateTime - Последняя отметка обработчика о работе.
+    Задача в статусе RUNNING без отметки дольше STALE_AFTER считается
+    брошенной (обработчик был остановлен) и захватывается заново.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STALE_AFTER = timedelta(minutes=10)
+    HEARTBEAT_INTERVAL = timedelta(seconds=30)
+    STATUS_CHOICES = [
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    start_date = models.DateField()
+    end_date = models.DateField()
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True
+    )
+    stage = models.CharField(max_length=50, blank=True)
+    stages = models.JSONField(default=dict)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    heartbeat_at = models.DateTimeField(null=True)
+
+    @staticmethod
+    def claim_next():
+        """
+        Захват самой старой задачи из очереди или брошенной задачи.
+        Статус меняется условным UPDATE, поэтому одну задачу
+        не возьмут два обработчика.
+        """
+        while True:
+            stale_before = timezone.now() - SyncJob.STALE_AFTER
+            job = SyncJob.objects.filter(
+                Q(status=SyncJob.PENDING)
+                | Q(status=SyncJob.RUNNING, heartbeat_at__lt=stale_before)
+                | Q(
+                    status=SyncJob.RUNNING,
+                    heartbeat_at__isnull=True,
+                    started_at__lt=stale_before
+                )
+            ).order_by('created_at', 'pk').first()
+            if job is None:
+                return None
+            now = timezone.now()
+            claimed = SyncJob.objects.filter(
+                pk=job.pk, status=job.status, heartbeat_at=job.heartbeat_at
+            ).update(
+                status=SyncJob.RUNNING, stage='', started_at=now, heartbeat_at=now
+            )
+            if claimed:
+                job.refresh_from_db()
+                return job
+
+    def heartbeat(self):
+        """
+        Отметка о том, что обработчик жив; в базу пишется не чаще
+        HEARTBEAT_INTERVAL.
+        """
+        now = timezone.now()
+        if self.heartbeat_at is None or (
+                now - self.heartbeat_at >= SyncJob.HEARTBEAT_INTERVAL):
+            self.heartbeat_at = now
+            self.save(update_fields=['heartbeat_at'])
+
+    def start_stage(self, name: str):
+        self.stage = name
+        self.heartbeat_at = timezone.now()
+        self.save(update_fields=['stage', 'heartbeat_at'])
+
+    def record_stage(self, name: str, duration: float, **stats):
+        self.stages[name] = {'duration': round(duration, 3), **stats}
+        self.heartbeat_at = timezone.now()
+        self.save(update_fields=['stages', 'heartbeat_at'])
+
+    def finish(self, error: str = ''):
+        self.status = SyncJob.FAILED if error else SyncJob.DONE
+        self.error = error
+        self.finished_at = timezone.now()
+        self.save(update_fields=['status', 'error', 'finished_at'])
+
+    @property
+    def duration(self) -> float | None:
+        if self.started_at is None:
+            return None
+        finished_at = self.finished_at or timezone.now()
+        return round((finished_at - self.started_at).total_seconds(), 3)
+
+
+class CurrencyRateRollup(models.Model):
+    """
+    Агрегаты курсов по неделям и месяцам для графиков за длинные периоды.
+    period: Char - Длина периода (неделя или месяц).
+    period_start: Date - Первый день периода (понедельник или 1-е число).
+    currency: Char - Валюта.
+    open_rate, high_rate, low_rate, close_rate: Decimal - Первый,
+    наибольший, наименьший и последний курс за период.
+    mean_rate: Decimal - Средний курс за период.
+    days: Integer - Количество дней с курсом в периоде.
+    Относительное изменение средним не хранится: оно линейно по курсу
+    и считается из mean_rate для любой базовой даты.
+    """
+    WEEK = 'week'
+    MONTH = 'month'
+    PERIOD_CHOICES = [(WEEK, 'Неделя'), (MONTH, 'Месяц')]
+
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    currency = models.CharField(max_length=50)
+    open_rate = models.DecimalField(max_digits=10, decimal_places=4)
+    high_rate = models.DecimalField(max_digits=10, decimal_places=4)
+    low_rate = models.DecimalField(max_digits=10, decimal_places=4)
+    close_rate = models.DecimalField(max_digits=10, decimal_places=4)
+    mean_rate = models.DecimalField(max_digits=10, decimal_places=4)
+    days = models.IntegerField()
+    upload_time = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('period', 'currency', 'period_start')
+
+    @staticmethod
+    @timed('upsert_rollups')
+    @transaction.atomic
+    def synchronize_rollups(
+            data, batch_size: int | None = None) -> UpsertResult:
+        """
+        Метод для добавления агрегатов в таблицу CurrencyRateRollup.
+        """
+        result = bulk_upsert(
+            CurrencyRateRollup,
+            data,
+            unique_fields=['period', 'currency', 'period_start'],
+            update_fields=[
+                'open_rate', 'high_rate', 'low_rate', 'close_rate',
+                'mean_rate', 'days'
+            ],
+            batch_size=batch_size
+        )
+        if result.inserted or result.updated:
+            DataVersion.bump()
+        return result
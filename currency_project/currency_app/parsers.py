@@ -0,0 +1,120 @@
+import io
+import re
+from datetime import date
+from lxml import etree
+
+
+def cell_text(cell) -> str:
+    return ''.join(cell.itertext()).strip()
+
+
+def iter_table_rows(content: bytes, table_class: str, encoding: str = None):
+    """
+    Потоковый разбор строк tbody таблицы с заданным классом.
+    Страница не строится в дерево целиком: разобранные строки
+    и всё, что было до них, сразу освобождаются.
+    Возвращает списки текстов ячеек td.
+    """
+    events = etree.iterparse(
+        io.BytesIO(content),
+        events=('end',),
+        tag='tr',
+        html=True,
+        encoding=encoding,
+        recover=True
+    )
+    for _, row in events:
+        body = row.getparent()
+        table = body.getparent() if body is not None else None
+        if (
+            body is not None and body.tag == 'tbody'
+            and table is not None and table.tag == 'table'
+            and table_class in (table.get('class') or '').split()
+        ):
+            cells = [cell_text(cell) for cell in row.iterchildren('td')]
+            if cells:
+                yield cells
+        row.clear()
+        while row.getprevious() is not None:
+            del row.getparent()[0]
+
+
+ISO_CODE = re.compile(r'\b([A-Z]{3})\b')
+
+
+def iter_select_options(content: bytes, select_name: str, encoding: str = None):
+    """
+    Потоковый разбор списка select с заданным именем:
+    пары (value, текст) его элементов option.
+    """
+    events = etree.iterparse(
+        io.BytesIO(content),
+        events=('end',),
+        tag='select',
+        html=True,
+        encoding=encoding,
+        recover=True
+    )
+    for _, select in events:
+        if select.get('name') == select_name:
+            for option in select.iterchildren('option'):
+                yield option.get('value', ''), cell_text(option)
+        select.clear()
+
+
+def parse_date(value: str) -> date:
+    """
+    Дата в формате ДД.ММ.ГГГГ; заметно быстрее datetime.strptime.
+    """
+    day, month, year = value.split('.')
+    return date(int(year), int(month), int(day))
+
+
+def parse_decimal(value: str) -> float:
+    return float(value.replace(',', '.').replace('\xa0', '').replace(' ', ''))
+
+
+def iter_finmarket_rates(content: bytes, encoding: str = None):
+    """
+    Строки архива курсов finmarket.ru (таблица karramba):
+    (дата, курс, изменение).
+    """
+    for cols in iter_table_rows(content, 'karramba', encoding):
+        if len(cols) < 4:
+            continue
+        yield (
+            parse_date(cols[0]),
+            parse_decimal(cols[2]),
+            parse_decimal(cols[3])
+        )
+
+
+def iter_iban_currencies(content: bytes, encoding: str = None):
+    """
+    Строки списка валют iban.ru (таблица tablesorter):
+    (страна, название валюты, код валюты, числовой код).
+    """
+    for cols in iter_table_rows(content, 'tablesorter', encoding):
+        if len(cols) < 4:
+            continue
+        yield (
+            cols[0],
+            cols[1],
+            cols[2],
+            int(cols[3]) if cols[3] != '' else 0
+        )
+
+
+def iter_finmarket_currencies(content: bytes, encoding: str = None):
+    """
+    Валюты из списка cur на странице курсов finmarket.ru:
+    (идентификатор на сайте, код ISO, название).
+    Элементы без числового идентификатора или кода ISO в тексте
+    пропускаются.
+    """
+    for value, text in iter_select_options(content, 'cur', encoding):
+        code = ISO_CODE.search(text)
+        if not value.isdigit() or code is None:
+            continue
+        name = text.replace(code.group(1), '').strip(' -–()')
+        yield int(value), code.group(1), name
@@ -0,0 +1,28 @@
+import threading
+from .cache import get_data_version
+from .models import UpstreamCurrency
+
+
+_lock = threading.Lock()
+_process_cache = (None, {})
+
+
+def get_currency_codes() -> dict[str, int]:
+    """
+    Активные валюты реестра {код ISO: идентификатор на finmarket.ru}.
+    Реестр хранится в памяти процесса под текущей версией данных
+    (см. cache.get_data_version) и перечитывается из базы только
+    после его изменения.
+    """
+    global _process_cache
+    version = get_data_version()
+    cached_version, codes = _process_cache
+    if cached_version != version:
+        with _lock:
+            codes = dict(
+                UpstreamCurrency.objects.filter(active=True)
+                .order_by('currency_code')
+                .values_list('currency_code', 'upstream_id')
+            )
+            _process_cache = (version, codes)
+    return dict(codes)
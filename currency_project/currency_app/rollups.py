@@ -0,0 +1,136 @@
+from datetime import date, timedelta
+import pandas as pd
+from django.conf import settings
+from django.db.models import FloatField, Max, Min
+from django.db.models.functions import Cast
+from .bulk import UpsertResult
+from .models import CurrencyRate, CurrencyRateRollup
+
+
+# Формы страниц ограничивают период двумя годами (730 дней): при 52
+# точках недельные агрегаты используются для периодов от года, месячные
+# (от 1560 дней) - только в JSON API, где длина периода не ограничена.
+MIN_CHART_POINTS = getattr(settings, 'MIN_CHART_POINTS', 52)
+# Периоды от крупного к мелкому и их примерная длина в днях
+ROLLUP_PERIODS = (
+    (CurrencyRateRollup.MONTH, 30),
+    (CurrencyRateRollup.WEEK, 7),
+)
+
+
+def period_start(value: date, period: str) -> date:
+    """
+    Первый день периода, в который попадает дата.
+    """
+    if period == CurrencyRateRollup.WEEK:
+        return value - timedelta(days=value.weekday())
+    return value.replace(day=1)
+
+
+def period_end(value: date, period: str) -> date:
+    """
+    Последний день периода, в который попадает дата.
+    """
+    if period == CurrencyRateRollup.WEEK:
+        return period_start(value, period) + timedelta(days=6)
+    next_month = value.replace(day=28) + timedelta(days=4)
+    return next_month - timedelta(days=next_month.day)
+
+
+def choose_period(
+        start_date: date,
+        end_date: date,
+        min_points: int | None = None
+        ) -> str | None:
+    """
+    Самый крупный период агрегатов, при котором на графике остаётся
+    не меньше min_points (по умолчанию MIN_CHART_POINTS) точек.
+    None - нужны дневные курсы.
+    """
+    min_points = min_points or MIN_CHART_POINTS
+    days = (end_date - start_date).days + 1
+    for period, length in ROLLUP_PERIODS:
+        if days // length >= min_points:
+            return period
+    return None
+
+
+def calculate_rollups(
+        currencies,
+        start_date: date,
+        end_date: date,
+        period: str
+        ) -> list[dict]:
+    """
+    Агрегаты курсов за периоды, пересекающиеся с [start_date, end_date].
+    Границы расширяются до целых периодов, чтобы агрегат учитывал
+    все дни периода, а не только изменённые.
+    """
+    start = period_start(start_date, period)
+    end = period_end(end_date, period)
+    rows = list(
+        CurrencyRate.objects.filter(
+            date__range=[start, end],
+            currency__in=currencies
+        )
+        .annotate(rate_value=Cast('rate', FloatField()))
+        .order_by('currency', 'date')
+        .values_list('currency', 'date', 'rate_value')
+    )
+    if not rows:
+        return []
+    frame = pd.DataFrame(rows, columns=['currency', 'date', 'rate'])
+    dates = pd.to_datetime(frame['date'])
+    if period == CurrencyRateRollup.WEEK:
+        frame['period_start'] = (
+            dates - pd.to_timedelta(dates.dt.weekday, unit='D')
+        ).dt.date
+    else:
+        frame['period_start'] = dates.dt.to_period('M').dt.start_time.dt.date
+    grouped = frame.groupby(['currency', 'period_start'], sort=False)['rate']
+    aggregated = grouped.agg(['first', 'max', 'min', 'last', 'mean', 'count'])
+    return [
+        {
+            'period': period,
+            'currency': currency,
+            'period_start': start_day,
+            'open_rate': open_rate,
+            'high_rate': high_rate,
+            'low_rate': low_rate,
+            'close_rate': close_rate,
+            'mean_rate': mean_rate,
+            'days': int(days),
+        }
+        for (currency, start_day), (
+            open_rate, high_rate, low_rate, close_rate, mean_rate, days
+        ) in zip(aggregated.index, aggregated.itertuples(index=False))
+    ]
+
+
+def refresh_rollups(
+        currencies=None,
+        start_date: date | None = None,
+        end_date: date | None = None
+        ) -> UpsertResult:
+    """
+    Пересчёт недельных и месячных агрегатов за период. Пересчитываются
+    только периоды, пересекающиеся с [start_date, end_date], поэтому
+    после синхронизации достаточно передать границы загруженных дат.
+    Без аргументов агрегаты строятся по всей таблице CurrencyRate.
+    """
+    if currencies is None:
+        currencies = list(
+            CurrencyRate.objects.values_list('currency', flat=True).distinct()
+        )
+    if start_date is None or end_date is None:
+        bounds = CurrencyRate.objects.aggregate(first=Min('date'), last=Max('date'))
+        start_date = start_date or bounds['first']
+        end_date = end_date or bounds['last']
+    result = UpsertResult()
+    if not currencies or start_date is None or end_date is None:
+        return result
+    for period, _ in ROLLUP_PERIODS:
+        result += CurrencyRateRollup.synchronize_rollups(
+            calculate_rollups(currencies, start_date, end_date, period)
+        )
+    return result
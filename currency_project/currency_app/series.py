@@ -0,0 +1,266 @@
+from array import array
+from datetime import date
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
+import numpy as np
+from django.conf import settings
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from .models import CurrencyRateRollup, RelativeChange
+from .rollups import period_start
+from .utils import (
+    HOLIDAY_TOLERANCE,
+    RATE_SCALE,
+    RateStore,
+    forward_fill,
+    get_rate_store,
+    relative_change_scaled
+)
+
+
+# Валюта, к которой хранятся курсы в CurrencyRate
+HOME_CURRENCY = 'RUB'
+RELATIVE_CHANGES_CACHE_SIZE = getattr(
+    settings, 'RELATIVE_CHANGES_CACHE_SIZE', 128
+)
+CHUNK_SIZE = 2000
+
+
+def group_rows(rows) -> dict[str, tuple[list[date], array]]:
+    """
+    Разбор упорядоченных по валюте строк (валюта, дата, значение)
+    за один проход: {валюта: (даты, значения в array('d'))}.
+    """
+    series = {}
+    for currency, group in groupby(rows, key=itemgetter(0)):
+        dates, values = series.setdefault(currency, ([], array('d')))
+        for _, row_date, value in group:
+            dates.append(row_date)
+            values.append(value)
+    return series
+
+
+@lru_cache(maxsize=RELATIVE_CHANGES_CACHE_SIZE)
+def relative_change_series(
+        base_date: date,
+        currencies: tuple[str, ...],
+        start_date: date,
+        end_date: date,
+        version: int = 0
+        ) -> dict[str, tuple[list[date], list[float]]]:
+    """
+    Расчёт относительного изменения курсов к произвольной базовой дате
+    по курсам из RateStore, без записи в таблицу RelativeChange
+    и без запросов к базе. Базой служит курс, действовавший на базовую
+    дату; ряды всех валют выравниваются по торговому календарю
+    с переносом последнего известного курса на пропущенные дни.
+    Результат кэшируется по (base_date, currencies, start_date, end_date,
+    version), поэтому currencies передаётся отсортированным кортежем,
+    а version - текущей версией данных (см. cache.get_data_version).
+    Возвращает {валюта: (даты, изменения в процентах)}.
+    """
+    store = get_rate_store()
+    days = store.calendar().between(start_date, end_date)
+    series = {}
+    for currency in currencies:
+        base = store.rate_as_of(currency, base_date)
+        # Без курсов валюты относительное изменение не определено.
+        if not base:
+            continue
+        rates, known = forward_fill(*store.slice(currency), days)
+        changes = relative_change_scaled(rates[known], base)
+        series[currency] = (
+            days[known].astype(object).tolist(),
+            (changes / RATE_SCALE).tolist()
+        )
+    return series
+
+
+@lru_cache(maxsize=RELATIVE_CHANGES_CACHE_SIZE)
+def rate_series(
+        currencies: tuple[str, ...],
+        start_date: date,
+        end_date: date,
+        version: int = 0
+        ) -> dict[str, tuple[list[date], list[float]]]:
+    """
+    Курсы валют к рублю за период из RateStore, {валюта: (даты, курсы)}.
+    Кэшируется так же, как relative_change_series.
+    """
+    store = get_rate_store()
+    series = {}
+    for currency in currencies:
+        dates, rates = store.slice(currency, start_date, end_date)
+        if len(dates):
+            series[currency] = (
+                dates.astype(object).tolist(),
+                (rates / RATE_SCALE).tolist()
+            )
+    return series
+
+
+@lru_cache(maxsize=RELATIVE_CHANGES_CACHE_SIZE)
+def stored_relative_change_series(
+        currencies: tuple[str, ...],
+        start_date: date,
+        end_date: date,
+        version: int = 0
+        ) -> dict[str, tuple[list[date], array]]:
+    """
+    Относительные изменения из таблицы RelativeChange (к базовой дате
+    последней синхронизации). Все валюты читаются одним запросом,
+    поэтому число запросов не зависит от количества валют.
+    """
+    rows = (
+        RelativeChange.objects.filter(
+            date__range=[start_date, end_date],
+            currency__in=currencies
+        )
+        .annotate(value=Cast('relative_change', FloatField()))
+        .order_by('currency', 'date')
+        .values_list('currency', 'date', 'value')
+    )
+    return group_rows(rows.iterator(chunk_size=CHUNK_SIZE))
+
+
+@lru_cache(maxsize=RELATIVE_CHANGES_CACHE_SIZE)
+def rollup_relative_change_series(
+        period: str,
+        base_date: date,
+        currencies: tuple[str, ...],
+        start_date: date,
+        end_date: date,
+        version: int = 0
+        ) -> dict[str, tuple[list[date], list[float]]]:
+    """
+    Относительные изменения по недельным или месячным агрегатам
+    (CurrencyRateRollup) для графиков за длинные периоды.
+    Изменение линейно по курсу, поэтому среднее изменение за период
+    считается из среднего курса: (mean_rate - base) / base * 100.
+    Точки ряда датируются первым днём периода.
+    """
+    store = get_rate_store()
+    base_rates = {}
+    for currency in currencies:
+        base = store.rate_as_of(currency, base_date)
+        if base:
+            base_rates[currency] = base / RATE_SCALE
+    if not base_rates:
+        return {}
+    rows = (
+        CurrencyRateRollup.objects.filter(
+            period=period,
+            currency__in=list(base_rates),
+            period_start__range=[period_start(start_date, period), end_date]
+        )
+        .annotate(value=Cast('mean_rate', FloatField()))
+        .order_by('currency', 'period_start')
+        .values_list('currency', 'period_start', 'value')
+    )
+    series = {}
+    for currency, (dates, means) in group_rows(rows).items():
+        base = base_rates[currency]
+        changes = (np.frombuffer(means) - base) / base * 100
+        series[currency] = (dates, changes.round(4).tolist())
+    return series
+
+
+def pair_label(pair: tuple[str, str]) -> str:
+    return '/'.join(pair)
+
+
+def aligned_rates(
+        store: RateStore,
+        currency: str,
+        days: np.ndarray
+        ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Курсы валюты к рублю (x 10^4) на даты days с переносом последнего
+    известного курса; рубль к рублю - 1.
+    """
+    if currency == HOME_CURRENCY:
+        return (
+            np.full(len(days), RATE_SCALE, dtype=np.int64),
+            np.ones(len(days), dtype=bool)
+        )
+    return forward_fill(*store.slice(currency), days)
+
+
+def cross_rates(
+        store: RateStore,
+        pair: tuple[str, str],
+        days: np.ndarray
+        ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Кросс-курс пары (base, quote) на даты days: отношение курсов обеих
+    валют к рублю, выровненных по датам. Возвращает (курсы, маска дат,
+    на которые известны курсы обеих валют).
+    """
+    base, quote = pair
+    numerator, known_base = aligned_rates(store, base, days)
+    denominator, known_quote = aligned_rates(store, quote, days)
+    known = known_base & known_quote & (denominator != 0)
+    rates = np.zeros(len(days), dtype=np.float64)
+    rates[known] = numerator[known] / denominator[known]
+    return rates, known
+
+
+@lru_cache(maxsize=RELATIVE_CHANGES_CACHE_SIZE)
+def cross_rate_series(
+        pairs: tuple[tuple[str, str], ...],
+        start_date: date,
+        end_date: date,
+        version: int = 0
+        ) -> dict[str, tuple[list[date], list[float]]]:
+    """
+    Кросс-курсы произвольных пар валют, полученные из курсов к рублю
+    без загрузки и хранения самих пар: {'EUR/USD': (даты, курсы)}.
+    Кэшируется так же, как relative_change_series.
+    """
+    store = get_rate_store()
+    days = store.calendar().between(start_date, end_date)
+    series = {}
+    for pair in pairs:
+        rates, known = cross_rates(store, pair, days)
+        if known.any():
+            series[pair_label(pair)] = (
+                days[known].astype(object).tolist(),
+                rates[known].round(6).tolist()
+            )
+    return series
+
+
+@lru_cache(maxsize=RELATIVE_CHANGES_CACHE_SIZE)
+def cross_relative_change_series(
+        pairs: tuple[tuple[str, str], ...],
+        base_date: date,
+        start_date: date,
+        end_date: date,
+        version: int = 0
+        ) -> dict[str, tuple[list[date], list[float]]]:
+    """
+    Относительное изменение кросс-курсов к курсу пары, действовавшему
+    на базовую дату, в процентах: {'EUR/USD': (даты, изменения)}.
+    """
+    store = get_rate_store()
+    days = store.calendar().between(start_date, end_date)
+    base_days = np.array([base_date], dtype='datetime64[D]')
+    base_days = store.calendar().as_of(base_days)
+    # Базовая дата раньше всех курсов: как и в RateStore.rate_as_of,
+    # первый торговый день подходит только в пределах праздников
+    if base_days[0] - np.datetime64(base_date, 'D') > HOLIDAY_TOLERANCE:
+        return {}
+    series = {}
+    for pair in pairs:
+        base_rate, base_known = cross_rates(store, pair, base_days)
+        if not base_known[0]:
+            continue
+        rates, known = cross_rates(store, pair, days)
+        if known.any():
+            changes = (rates[known] / base_rate[0] - 1) * 100
+            series[pair_label(pair)] = (
+                days[known].astype(object).tolist(),
+                changes.round(4).tolist()
+            )
+    return series
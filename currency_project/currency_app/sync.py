@@ -0,0 +1,164 @@
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import asdict
+from datetime import date
+import requests
+from .bulk import UpsertResult
+from .http_cache import prune_http_cache
+from .models import (
+    CountryCurrency,
+    CurrencyRate,
+    RelativeChange,
+    SyncJob,
+    SyncParameter,
+    UpstreamCurrency
+)
+from .metrics import span
+from .registry import get_currency_codes
+from .rollups import refresh_rollups
+from .utils import (
+    CountryCurrencyFetcher,
+    CurrencyFetcher,
+    CurrencyRegistryFetcher,
+    RelativeChangeCalculator,
+    SyncPlanner
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class SyncRun:
+    """
+    Синхронизация данных за период: загрузка курсов и списка валют,
+    запись в базу и пересчёт относительных изменений.
+    Длительность и количество строк каждого этапа сохраняются в stages
+    и, если передана задача SyncJob, в её записи.
+    """
+    def __init__(self, start_date: date, end_date: date, job: SyncJob = None):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.job = job
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        if self.job is not None:
+            self.job.start_stage(name)
+        stats = {}
+        started = time.perf_counter()
+        with span(f'sync_{name}'):
+            yield stats
+        duration = time.perf_counter() - started
+        self.stages[name] = {'duration': round(duration, 3), **stats}
+        if self.job is not None:
+            self.job.record_stage(name, duration, **stats)
+
+    @staticmethod
+    def upsert_stats(result: UpsertResult) -> dict:
+        return {'rows': result.total, **asdict(result)}
+
+    def update_currencies(self) -> dict[str, int]:
+        """
+        Обновление реестра валют источника. При недоступности страницы
+        синхронизация идёт по уже известным валютам.
+        Возвращает активные валюты реестра.
+        """
+        with self.stage('currencies') as stats:
+            try:
+                upstream_currencies = (
+                    CurrencyRegistryFetcher().fetch_upstream_currencies()
+                )
+            except requests.RequestException as error:
+                logger.warning('Реестр валют не обновлён: %s', error)
+                upstream_currencies = []
+            stats.update(self.upsert_stats(
+                UpstreamCurrency.synchronize_upstream_currencies(
+                    upstream_currencies
+                )
+            ))
+        return get_currency_codes()
+
+    def update_countries(self):
+        """
+        Обновление списка валют стран. При недоступности страницы
+        остаётся сохранённый ранее список.
+        """
+        with self.stage('fetch_countries') as stats:
+            try:
+                country_data = CountryCurrencyFetcher().fetch_country_currencies()
+            except requests.RequestException as error:
+                logger.warning('Список валют стран не обновлён: %s', error)
+                country_data = []
+            stats['rows'] = len(country_data)
+
+        with self.stage('save_countries') as stats:
+            stats.update(self.upsert_stats(
+                CountryCurrency.synchronize_country_currencies(country_data)
+            ))
+
+    def prune_http_cache(self):
+        with self.stage('prune_http_cache') as stats:
+            stats['rows'] = prune_http_cache()
+
+    def run(self) -> dict:
+        currencies = self.update_currencies()
+
+        with self.stage('rates') as stats:
+            # Загружаем только те периоды, которых ещё нет в базе;
+            # пакеты пишутся в базу, пока загружаются остальные валюты
+            plan = SyncPlanner(self.start_date, self.end_date, currencies).plan()
+            currency_fetcher = CurrencyFetcher(
+                self.start_date, self.end_date,
+                plan=plan,
+                currencies=currencies
+            )
+            result = UpsertResult()
+            first_date = last_date = None
+            for batch in currency_fetcher.iter_currency_rate_batches():
+                result += CurrencyRate.synchronize_currency_rates(batch)
+                if self.job is not None:
+                    self.job.heartbeat()
+                batch_dates = [row['date'] for row in batch]
+                first_date = min(first_date or batch_dates[0], *batch_dates)
+                last_date = max(last_date or batch_dates[0], *batch_dates)
+            SyncPlanner.record(currency_fetcher.completed_tasks)
+            stats.update(self.upsert_stats(result))
+
+        with self.stage('rollups') as stats:
+            # Пересчитываются только недели и месяцы с новыми курсами
+            if result.inserted or result.updated:
+                result = refresh_rollups(currencies, first_date, last_date)
+            else:
+                result = UpsertResult()
+            stats.update(self.upsert_stats(result))
+
+        self.update_countries()
+
+        # Сохранение параметра. Происходит разово
+        SyncParameter.objects.update_or_create(
+            param_name='base_date', defaults={'param_value': self.start_date}
+        )
+
+        with self.stage('relative_changes') as stats:
+            relative_change_calculator = RelativeChangeCalculator(self.start_date)
+            relative_changes = relative_change_calculator.calculate_relative_changes()
+            stats.update(self.upsert_stats(
+                RelativeChange.synchronize_relative_changes(relative_changes)
+            ))
+
+        self.prune_http_cache()
+        return self.stages
+
+
+def run_job(job: SyncJob):
+    """
+    Выполнение задачи из очереди с сохранением результата или ошибки.
+    """
+    try:
+        SyncRun(job.start_date, job.end_date, job=job).run()
+    except Exception as error:
+        job.finish(error=f'{type(error).__name__}: {error}')
+        raise
+    job.finish()
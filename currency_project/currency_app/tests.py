@@ -1,3 +1,1190 @@
-from django.test import TestCase
+import io
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from collections import defaultdict
+from decimal import ROUND_HALF_EVEN, Decimal
+from unittest import skipUnless
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+import numpy as np
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from .bulk import bulk_upsert, chunked
+from .cache import chart_cache_key, get_chart_cache, get_data_version
+from .charts import render_relative_changes
+from .db import COPY_THRESHOLD
+from .downsampling import bucket_mean, downsample, lttb
+from .export import parquet_available
+from .http_cache import HTTPCache
+from .metrics import span, start_metrics_server
+from .models import (
+    CountryCurrency,
+    CurrencyRate,
+    CurrencyRateRollup,
+    DataVersion,
+    FetchedPeriod,
+    RelativeChange,
+    SyncJob,
+    SyncParameter,
+    UpstreamCurrency
+)
+from .parsers import (
+    iter_finmarket_currencies,
+    iter_finmarket_rates,
+    iter_iban_currencies
+)
+from .rollups import choose_period, refresh_rollups
+from .series import (
+    cross_rate_series,
+    cross_relative_change_series,
+    rate_series,
+    relative_change_series,
+    rollup_relative_change_series,
+    stored_relative_change_series
+)
+from .sync import SyncRun
+from .utils import (
+    CountryCurrencyFetcher,
+    CurrencyFetcher,
+    CurrencyRegistryFetcher,
+    HostLimiter,
+    RelativeChangeCalculator,
+    SyncPlanner,
+    create_http_session,
+    get_rate_store
+)
+from .views import CurrencyTuple, load_currency_relative_changes
 
-# Create your tests here.
+
+# Сохранённые страницы источников (упрощены, разметка сохранена)
+TEST_PAGES = Path(__file__).resolve().parent / 'test_pages'
+
+
+def read_page(name: str) -> bytes:
+    return (TEST_PAGES / name).read_bytes()
+
+
+class ParserTests(SimpleTestCase):
+    def test_finmarket_rates(self):
+        # Заголовок в thead, вложенные теги в ячейках, неразрывный
+        # пробел в числе; строка-примечание из одной ячейки пропускается
+        content = read_page('finmarket_rates.html')
+        self.assertEqual(list(iter_finmarket_rates(content)), [
+            (date(2024, 3, 1), 90.8284, -0.3046),
+            (date(2024, 3, 2), 91.4125, 0.5841),
+            (date(2024, 3, 5), 91234.5, 0.0),
+        ])
+
+    def test_finmarket_windows_1251(self):
+        # Кодировка из заголовка ответа и из meta страницы дают одно и то же
+        content = read_page('finmarket_rates.html')
+        self.assertEqual(
+            list(iter_finmarket_rates(content, 'windows-1251')),
+            list(iter_finmarket_rates(content))
+        )
+        self.assertEqual(
+            list(iter_finmarket_currencies(content, 'windows-1251')),
+            list(iter_finmarket_currencies(content))
+        )
+
+    def test_finmarket_without_table(self):
+        content = read_page('finmarket_no_table.html')
+        self.assertEqual(list(iter_finmarket_rates(content)), [])
+        self.assertEqual(list(iter_finmarket_currencies(content)), [])
+
+    def test_finmarket_currencies(self):
+        # Элементы без числового идентификатора или кода ISO пропускаются
+        self.assertEqual(
+            list(iter_finmarket_currencies(read_page('finmarket_rates.html'))),
+            [
+                (52148, 'USD', 'Доллар США'),
+                (52170, 'EUR', 'Евро'),
+                (52146, 'GBP', 'Английский фунт стерлингов'),
+                (52207, 'CNY', 'Китайский юань'),
+            ]
+        )
+
+    def test_iban_currencies(self):
+        self.assertEqual(
+            list(iter_iban_currencies(read_page('iban_currencies.html'))),
+            [
+                ('Австралия', 'Австралийский доллар', 'AUD', 36),
+                ('Еврозона', 'Евро', 'EUR', 978),
+                ('Антарктида', 'Нет универсальной валюты', '', 0),
+            ]
+        )
+
+
+class RelativeChangeTests(TestCase):
+    def setUp(self):
+        DataVersion.forget()
+        get_rate_store().reset()
+
+    def legacy_changes(self, base_date) -> dict:
+        """
+        Прежний построчный расчёт на Decimal с округлением, как при
+        сохранении в DecimalField(decimal_places=4).
+        """
+        changes = {}
+        for base_rate in CurrencyRate.objects.filter(date=base_date):
+            for rate in CurrencyRate.objects.filter(currency=base_rate.currency):
+                change = (rate.rate - base_rate.rate) / base_rate.rate * 100
+                changes[(rate.date, rate.currency)] = change.quantize(
+                    Decimal('0.0001'), rounding=ROUND_HALF_EVEN
+                )
+        return changes
+
+    def test_matches_legacy_decimal_formula(self):
+        base_date = date(2024, 1, 1)
+        # При курсе 8 изменение на 0.0001 - ровно половина последнего
+        # знака (0.00125 %): округляется к чётному в обе стороны от нуля
+        rates = [('USD', '8'), ('USD', '8.0001'), ('USD', '8.0003'),
+                 ('USD', '7.9999'), ('USD', '7.9997')]
+        generator = random.Random(4)
+        rates += [('EUR', '98.7654')] + [
+            ('EUR', str(Decimal(generator.randint(500000, 1500000)).scaleb(-4)))
+            for _ in range(200)
+        ]
+        days = defaultdict(int)
+        rows = []
+        for currency, rate in rates:
+            rows.append({
+                'date': base_date + timedelta(days=days[currency]),
+                'currency': currency, 'rate': Decimal(rate), 'change': 0,
+                'currency_code': 1
+            })
+            days[currency] += 1
+        CurrencyRate.synchronize_currency_rates(rows)
+
+        actual = {
+            (row['date'], row['currency']): row['relative_change']
+            for row in RelativeChangeCalculator(base_date).calculate_relative_changes()
+        }
+        expected = self.legacy_changes(base_date)
+        self.assertEqual(len(actual), len(rows))
+        self.assertEqual(actual, expected)
+        self.assertEqual(
+            [actual[(base_date + timedelta(days=day), 'USD')] for day in range(5)],
+            [Decimal(value) for value in ('0', '0.0012', '0.0038', '-0.0012', '-0.0038')]
+        )
+        self.assertTrue(any(value < 0 for value in actual.values()))
+
+
+@override_settings(HTTP_CACHE=None)
+class CurrencyBatchTests(SimpleTestCase):
+    def fetcher(self, counts, fail=(), **kwargs):
+        """
+        Загрузчик, у которого fetch_currency возвращает counts[валюта]
+        строк или падает для валют из fail.
+        """
+        fetcher = CurrencyFetcher(
+            date(2024, 1, 1), date(2024, 1, 31),
+            currencies={currency: code for code, currency in enumerate(counts)},
+            **kwargs
+        )
+
+        def fetch_currency(currency, code, start_date, end_date):
+            if currency in fail:
+                raise requests.ConnectionError(currency)
+            return [
+                {'currency': currency, 'day': day}
+                for day in range(counts[currency])
+            ]
+
+        fetcher.fetch_currency = mock.Mock(side_effect=fetch_currency)
+        return fetcher
+
+    def test_batch_boundaries(self):
+        fetcher = self.fetcher({'USD': 7, 'EUR': 5, 'CNY': 0})
+        batches = list(fetcher.iter_currency_rate_batches(batch_size=4))
+        # Все пакеты, кроме последнего, полные, строки не теряются
+        self.assertEqual([len(batch) for batch in batches], [4, 4, 4])
+        self.assertEqual(
+            sorted((row['currency'], row['day']) for batch in batches for row in batch),
+            sorted(
+                [('USD', day) for day in range(7)]
+                + [('EUR', day) for day in range(5)]
+            )
+        )
+        self.assertEqual(
+            sorted((task[0], task[3]) for task in fetcher.completed_tasks),
+            [('CNY', 0), ('EUR', 5), ('USD', 7)]
+        )
+
+    def test_fetch_error_is_raised(self):
+        fetcher = self.fetcher({'USD': 3, 'EUR': 3}, fail={'EUR'}, max_workers=1)
+        with self.assertRaises(requests.ConnectionError):
+            list(fetcher.iter_currency_rate_batches(batch_size=2))
+        self.assertNotIn('EUR', [task[0] for task in fetcher.completed_tasks])
+
+    def test_close_after_first_batch(self):
+        counts = {currency: 10 for currency in ('USD', 'EUR', 'CNY', 'JPY', 'GBP')}
+        fetcher = self.fetcher(counts, max_workers=1)
+        batches = fetcher.iter_currency_rate_batches(batch_size=2, queue_size=1)
+        self.assertEqual(len(next(batches)), 2)
+        # Закрытие генератора останавливает загрузчики и не ждёт
+        # оставшиеся запросы
+        batches.close()
+        self.assertLess(fetcher.fetch_currency.call_count, len(counts))
+        self.assertEqual(fetcher.completed_tasks, [])
+
+
+class SyncPlannerTests(TestCase):
+    def add_rates(self, currency, *dates):
+        CurrencyRate.objects.bulk_create([
+            CurrencyRate(
+                date=rate_date, currency=currency, rate=1, change=0,
+                currency_code=1
+            )
+            for rate_date in dates
+        ])
+
+    def test_gap_between_fetched_periods_is_missing(self):
+        SyncPlanner.record([
+            ('USD', date(2024, 3, 1), date(2024, 3, 8), 6),
+            ('USD', date(2024, 3, 19), date(2024, 3, 29), 9),
+        ])
+        plan = SyncPlanner(date(2024, 3, 1), date(2024, 3, 29), ['USD']).plan()
+        self.assertEqual(plan, {'USD': [(date(2024, 3, 9), date(2024, 3, 18))]})
+
+    def test_fetched_period_covers_holidays(self):
+        SyncPlanner.record([('USD', date(2024, 1, 1), date(2024, 1, 31), 2)])
+        self.add_rates('USD', date(2024, 1, 9), date(2024, 1, 31))
+        plan = SyncPlanner(date(2024, 1, 1), date(2024, 1, 31), ['USD']).plan()
+        self.assertEqual(plan, {'USD': []})
+
+    def test_rates_without_fetched_periods(self):
+        # Курсы, загруженные до появления FetchedPeriod: пропуски
+        # по выходным объединяются в один период
+        self.add_rates('EUR', date(2024, 3, 1), date(2024, 3, 4), date(2024, 3, 5))
+        plan = SyncPlanner(
+            date(2024, 3, 1), date(2024, 3, 10), ['EUR', 'USD']
+        ).plan()
+        self.assertEqual(plan, {
+            'EUR': [(date(2024, 3, 2), date(2024, 3, 10))],
+            'USD': [(date(2024, 3, 1), date(2024, 3, 10))],
+        })
+
+    def test_today_is_not_recorded(self):
+        today = date.today()
+        SyncPlanner.record([('USD', today, today, 1)])
+        self.assertFalse(FetchedPeriod.objects.exists())
+
+    def test_empty_period_with_weekdays_is_not_recorded(self):
+        # Пустой ответ за рабочие дни может быть страницей ошибки,
+        # пустой ответ за выходные - нет
+        SyncPlanner.record([
+            ('USD', date(2024, 3, 4), date(2024, 3, 8), 0),
+            ('USD', date(2024, 3, 9), date(2024, 3, 10), 0),
+        ])
+        self.assertEqual(
+            list(FetchedPeriod.objects.values_list('start_date', 'end_date')),
+            [(date(2024, 3, 9), date(2024, 3, 10))]
+        )
+
+    @override_settings(HTTP_CACHE=None)
+    def test_sync_with_empty_pages_is_planned_again(self):
+        error = requests.ConnectionError('недоступно')
+        with mock.patch.object(
+                CurrencyRegistryFetcher, 'fetch_upstream_currencies',
+                side_effect=error), \
+                mock.patch.object(
+                    CountryCurrencyFetcher, 'fetch_country_currencies',
+                    side_effect=error), \
+                mock.patch.object(
+                    CurrencyFetcher, 'fetch_currency', return_value=[]), \
+                self.assertLogs('currency_app.sync', 'WARNING'):
+            SyncRun(date(2020, 3, 1), date(2020, 3, 31)).run()
+        self.assertFalse(FetchedPeriod.objects.exists())
+        plan = SyncPlanner(date(2020, 3, 1), date(2020, 3, 31), ['USD']).plan()
+        self.assertEqual(plan, {'USD': [(date(2020, 3, 1), date(2020, 3, 31))]})
+
+
+class DataVersionTests(TestCase):
+    def setUp(self):
+        DataVersion.forget()
+
+    def test_write_bumps_version_in_database(self):
+        version = get_data_version()
+        CurrencyRate.synchronize_currency_rates([{
+            'date': date(2024, 3, 1), 'currency': 'USD', 'rate': 90,
+            'change': 0, 'currency_code': 52148
+        }])
+        self.assertEqual(get_data_version(), version + 1)
+        self.assertEqual(DataVersion.objects.get().version, version + 1)
+
+    @mock.patch.object(DataVersion, 'CACHE_SECONDS', 0)
+    def test_change_from_other_process_is_seen(self):
+        version = get_data_version()
+        # Запись другого процесса: меняется только строка в базе
+        DataVersion.objects.update_or_create(
+            pk=1, defaults={'version': version + 5}
+        )
+        self.assertEqual(get_data_version(), version + 5)
+
+
+class SyncJobTests(TestCase):
+    def test_stale_running_job_is_reclaimed(self):
+        job = SyncJob.objects.create(
+            start_date=date(2024, 1, 1), end_date=date(2024, 1, 31)
+        )
+        self.assertEqual(SyncJob.claim_next().pk, job.pk)
+        self.assertIsNone(SyncJob.claim_next())
+        SyncJob.objects.filter(pk=job.pk).update(
+            heartbeat_at=timezone.now() - SyncJob.STALE_AFTER * 2
+        )
+        reclaimed = SyncJob.claim_next()
+        self.assertEqual(reclaimed.pk, job.pk)
+        self.assertEqual(reclaimed.status, SyncJob.RUNNING)
+        self.assertIsNone(SyncJob.claim_next())
+
+
+# Загрузчики не должны писать в кэш ответов проекта (BASE_DIR/http_cache)
+@override_settings(HTTP_CACHE=None)
+class BackfillTests(TestCase):
+    @staticmethod
+    def fetch_currency(fetcher, currency, code, start_date, end_date):
+        return [{
+            'date': start_date, 'currency': currency, 'rate': 10,
+            'change': 0, 'currency_code': code
+        }]
+
+    def test_reference_pages_unavailable(self):
+        # Страницы реестра и списка стран недоступны: курсы загружаются
+        # по валютам, уже известным реестру
+        error = requests.ConnectionError('недоступно')
+        with mock.patch.object(
+                CurrencyRegistryFetcher, 'fetch_upstream_currencies',
+                side_effect=error), \
+                mock.patch.object(
+                    CountryCurrencyFetcher, 'fetch_country_currencies',
+                    side_effect=error), \
+                mock.patch.object(
+                    CurrencyFetcher, 'fetch_currency',
+                    autospec=True, side_effect=self.fetch_currency):
+            with self.assertLogs('currency_app.sync', 'WARNING'):
+                call_command(
+                    'backfill', '2024-03-01', '2024-03-05', stdout=StringIO()
+                )
+        self.assertEqual(
+            CurrencyRate.objects.filter(date=date(2024, 3, 1)).count(),
+            UpstreamCurrency.objects.filter(active=True).count()
+        )
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Заменитель сайта-источника: отдаёт страницы server.pages по пути
+    без параметров, с ETag и ответом 304 на условный запрос.
+    """
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        self.server.requests.append((path, self.headers.get('If-None-Match')))
+        content = self.server.pages[path]
+        etag = f'"{len(content)}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """
+    Отвечает 503 на первые server.failures запросов, затем 200.
+    """
+    def do_GET(self):
+        self.server.requests += 1
+        status = 503 if self.server.requests <= self.server.failures else 200
+        self.send_response(status)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+class HTTPSessionTests(SimpleTestCase):
+    def start_server(self, failures):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+        server.failures = failures
+        server.requests = 0
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, f'http://127.0.0.1:{server.server_port}/'
+
+    def test_retry_with_backoff(self):
+        server, url = self.start_server(failures=3)
+        session = create_http_session(retries=3, backoff_factor=0.5)
+        with mock.patch('urllib3.util.retry.time.sleep') as sleep:
+            response = session.get(url, timeout=5)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(server.requests, 4)
+        # Задержка удваивается с каждой повторной ошибкой
+        self.assertEqual(
+            [call.args[0] for call in sleep.call_args_list], [1.0, 2.0]
+        )
+
+    def test_retries_exhausted(self):
+        server, url = self.start_server(failures=10)
+        session = create_http_session(retries=2, backoff_factor=0)
+        with self.assertRaises(requests.exceptions.RetryError):
+            session.get(url, timeout=5)
+        self.assertEqual(server.requests, 3)
+
+    def test_pool_size(self):
+        session = create_http_session(pool_size=7)
+        adapter = session.get_adapter('https://www.finmarket.ru/')
+        self.assertEqual(adapter._pool_maxsize, 7)
+        self.assertIn(429, adapter.max_retries.status_forcelist)
+
+    def test_per_host_limit(self):
+        limiter = HostLimiter(2)
+        release = threading.Event()
+        entered = threading.Semaphore(0)
+
+        def hold(url):
+            with limiter.for_url(url):
+                entered.release()
+                release.wait(5)
+
+        threads = [
+            threading.Thread(target=hold, args=('https://a.example/page',))
+            for _ in range(3)
+        ]
+        self.addCleanup(release.set)
+        for thread in threads:
+            thread.start()
+        self.assertTrue(entered.acquire(timeout=5))
+        self.assertTrue(entered.acquire(timeout=5))
+        # Третий запрос к тому же хосту ждёт, к другому хосту - нет
+        self.assertFalse(entered.acquire(timeout=0.2))
+        other = threading.Thread(target=hold, args=('https://b.example/',))
+        other.start()
+        self.assertTrue(entered.acquire(timeout=5))
+        release.set()
+        self.assertTrue(entered.acquire(timeout=5))
+        for thread in threads + [other]:
+            thread.join(5)
+
+    def test_rate_limit_spaces_requests(self):
+        limiter = HostLimiter(4, rate=10)
+        with mock.patch('currency_app.utils.time.monotonic', return_value=100.0), \
+                mock.patch('currency_app.utils.time.sleep') as sleep:
+            for _ in range(3):
+                limiter.wait_turn('a.example')
+            limiter.wait_turn('b.example')
+        self.assertEqual(
+            [round(call.args[0], 6) for call in sleep.call_args_list], [0.1, 0.2]
+        )
+
+
+class HTTPCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.server.pages = {
+            '/currency-codes': read_page('iban_currencies.html'),
+            '/currency/rates/': read_page('finmarket_rates.html'),
+        }
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.http_cache = HTTPCache(directory.name)
+
+    def fetch_countries(self, ttl):
+        fetcher = CountryCurrencyFetcher(http_cache=self.http_cache)
+        fetcher.URL = self.base_url + '/currency-codes'
+        with mock.patch('currency_app.utils.get_ttl', return_value=ttl), \
+                mock.patch(
+                    'currency_app.utils.iter_iban_currencies',
+                    wraps=iter_iban_currencies) as parser:
+            rows = fetcher.fetch_country_currencies()
+        return rows, parser.call_count
+
+    def fetch_rates(self, start_date, end_date):
+        fetcher = CurrencyFetcher(
+            start_date, end_date, currencies={'USD': 52148},
+            http_cache=self.http_cache
+        )
+        fetcher.BASE_URL = self.base_url + '/currency/rates/'
+        return fetcher.fetch_currency('USD', 52148, start_date, end_date)
+
+    def test_conditional_request(self):
+        rows, parsed = self.fetch_countries(ttl=3600)
+        self.assertEqual((len(rows), parsed), (3, 1))
+        # Свежая копия: ни запроса, ни разбора
+        self.assertEqual(self.fetch_countries(ttl=3600), (rows, 0))
+        self.assertEqual(len(self.server.requests), 1)
+        # Устаревшая копия: условный запрос, ответ 304, разбор не нужен
+        self.assertEqual(self.fetch_countries(ttl=0), (rows, 0))
+        etag = f'"{len(read_page("iban_currencies.html"))}"'
+        self.assertEqual(self.server.requests[-1], ('/currency-codes', etag))
+
+    def test_closed_range_is_permanent(self):
+        rows = self.fetch_rates(date(2024, 3, 1), date(2024, 3, 5))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(self.fetch_rates(date(2024, 3, 1), date(2024, 3, 5)), rows)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_page_without_table_is_not_cached(self):
+        # Страница ошибки с кодом 200 за закрытый период
+        self.server.pages['/currency/rates/'] = read_page('finmarket_no_table.html')
+        self.assertEqual(self.fetch_rates(date(2024, 3, 1), date(2024, 3, 5)), [])
+        self.server.pages['/currency/rates/'] = read_page('finmarket_rates.html')
+        rows = self.fetch_rates(date(2024, 3, 1), date(2024, 3, 5))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_cache_hits_skip_rate_limit(self):
+        # Свежие копии отдаются без очереди к хосту и без запроса к сайту
+        fetcher = CountryCurrencyFetcher(http_cache=self.http_cache)
+        urls = [f'{self.base_url}/page/{number}' for number in range(30)]
+        for url in urls:
+            self.http_cache.store(url, {}, b'cached')
+        with mock.patch.object(
+                fetcher.host_limiter, 'wait_turn',
+                wraps=fetcher.host_limiter.wait_turn) as wait_turn, \
+                mock.patch.object(
+                    fetcher.session, 'get', wraps=fetcher.session.get) as get:
+            for url in urls:
+                self.assertEqual(fetcher.get(url, ttl=None).content, b'cached')
+            wait_turn.assert_not_called()
+            get.assert_not_called()
+            # Промах кэша проходит через ограничитель и сессию
+            fetcher.get(self.base_url + '/currency-codes', ttl=None)
+            wait_turn.assert_called_once()
+            get.assert_called_once()
+        self.assertEqual(self.server.requests, [('/currency-codes', None)])
+
+    def test_rate_limit_can_be_disabled(self):
+        fetcher = CountryCurrencyFetcher(http_cache=self.http_cache, rate_limit=0)
+        self.assertEqual(fetcher.host_limiter.rate, 0)
+
+    def test_prune(self):
+        for number in range(3):
+            url = f'{self.base_url}/page/{number}'
+            self.http_cache.store(url, {}, b'x' * 100)
+            used = time.time() - (3 - number) * 3600
+            os.utime(self.http_cache.path(url, 'json'), (used, used))
+        # Самая старая запись удаляется по возрасту, следующая - по размеру
+        self.assertEqual(self.http_cache.prune(max_age=2.5 * 3600), 1)
+        self.assertEqual(self.http_cache.prune(max_size=150), 1)
+        self.assertIsNone(self.http_cache.load(f'{self.base_url}/page/1'))
+        self.assertIsNotNone(self.http_cache.load(f'{self.base_url}/page/2'))
+
+
+class BulkUpsertTests(TestCase):
+    def rows(self, count, rate=10, start=0):
+        return [
+            {
+                'date': date.fromordinal(date(2024, 1, 1).toordinal() + day),
+                'currency': 'USD', 'rate': rate, 'change': 0,
+                'currency_code': 52148
+            }
+            for day in range(start, start + count)
+        ]
+
+    def upsert(self, rows, batch_size=None):
+        return bulk_upsert(
+            CurrencyRate, rows,
+            unique_fields=['date', 'currency'],
+            update_fields=['rate', 'change', 'currency_code'],
+            batch_size=batch_size
+        )
+
+    def check_upsert(self):
+        result = self.upsert(self.rows(5), batch_size=2)
+        self.assertEqual(
+            (result.inserted, result.updated, result.unchanged), (5, 0, 0)
+        )
+        first = CurrencyRate.objects.get(date=date(2024, 1, 1))
+        rows = self.rows(3, rate=10) + self.rows(2, rate='11.00001', start=3)
+        # Повтор ключа: побеждает последняя строка
+        rows.append({**rows[0], 'rate': 12})
+        result = self.upsert(rows, batch_size=2)
+        self.assertEqual(
+            (result.inserted, result.updated, result.unchanged), (0, 3, 2)
+        )
+        rates = CurrencyRate.objects.order_by('date').values_list('rate', flat=True)
+        self.assertEqual(list(rates), [12, 10, 10, 11, 11])
+        # У изменённой записи обновляется upload_time (auto_now)
+        self.assertGreater(
+            CurrencyRate.objects.get(date=date(2024, 1, 1)).upload_time,
+            first.upload_time
+        )
+
+    def test_upsert_on_conflict(self):
+        self.check_upsert()
+
+    def test_upsert_bulk_update(self):
+        with mock.patch(
+                'currency_app.bulk.supports_conflict_update', return_value=False):
+            self.check_upsert()
+
+    def test_copy_threshold_counts_all_batches(self):
+        # Новые записи нескольких пакетов одного вызова уходят одной
+        # командой COPY, если их не меньше COPY_THRESHOLD
+        with mock.patch('currency_app.bulk.supports_copy', return_value=True), \
+                mock.patch('currency_app.bulk.copy_insert') as copy_insert:
+            result = self.upsert(
+                self.rows(COPY_THRESHOLD), batch_size=COPY_THRESHOLD // 4
+            )
+            self.upsert(self.rows(COPY_THRESHOLD - 1, start=COPY_THRESHOLD))
+        self.assertEqual(result.inserted, COPY_THRESHOLD)
+        self.assertEqual(copy_insert.call_count, 1)
+        self.assertEqual(len(copy_insert.call_args.args[1]), COPY_THRESHOLD)
+        self.assertEqual(CurrencyRate.objects.count(), COPY_THRESHOLD - 1)
+
+    def upsert_racing(self, rows):
+        # Другой процесс добавляет запись с тем же ключом после того,
+        # как существующие записи уже прочитаны
+        def racing_chunked(items, size):
+            yield from chunked(items, size)
+            CurrencyRate.objects.create(**{**self.rows(1)[0], 'rate': 9})
+
+        with mock.patch('currency_app.bulk.chunked', racing_chunked):
+            return self.upsert(rows)
+
+    def test_concurrent_insert_is_updated(self):
+        result = self.upsert_racing(self.rows(3))
+        self.assertEqual(result.inserted, 3)
+        self.assertEqual(CurrencyRate.objects.count(), 3)
+        self.assertEqual(
+            CurrencyRate.objects.get(date=date(2024, 1, 1)).rate, 10
+        )
+
+    def test_concurrent_insert_is_ignored_without_conflict_update(self):
+        with mock.patch(
+                'currency_app.bulk.supports_conflict_update', return_value=False):
+            self.upsert_racing(self.rows(3))
+        self.assertEqual(CurrencyRate.objects.count(), 3)
+        self.assertEqual(
+            CurrencyRate.objects.get(date=date(2024, 1, 1)).rate, 9
+        )
+
+    def test_copy_conflict_falls_back_to_insert(self):
+        with mock.patch('currency_app.bulk.supports_copy', return_value=True), \
+                mock.patch(
+                    'currency_app.bulk.copy_insert', side_effect=IntegrityError
+                ) as copy_insert:
+            result = self.upsert_racing(self.rows(COPY_THRESHOLD))
+        self.assertEqual(copy_insert.call_count, 1)
+        self.assertEqual(result.inserted, COPY_THRESHOLD)
+        self.assertEqual(CurrencyRate.objects.count(), COPY_THRESHOLD)
+
+    def test_copy_threshold_below_batch_size(self):
+        self.assertLess(COPY_THRESHOLD, settings.CURRENCY_SYNC_BATCH_SIZE)
+
+    def test_sqlite_pragmas(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA temp_store')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+
+class RollupFallbackTests(TestCase):
+    def setUp(self):
+        # Кэши процесса привязаны к версии данных, которая откатывается
+        # вместе с транзакцией теста
+        DataVersion.forget()
+        get_rate_store().reset()
+        relative_change_series.cache_clear()
+        rollup_relative_change_series.cache_clear()
+
+    start_date = date(2022, 1, 1)
+    end_date = date(2023, 12, 31)
+
+    def add_rates(self):
+        days = (self.end_date - self.start_date).days + 1
+        CurrencyRate.synchronize_currency_rates([
+            {
+                'date': date.fromordinal(self.start_date.toordinal() + day),
+                'currency': currency, 'rate': 10 + day / 100, 'change': 0,
+                'currency_code': 1
+            }
+            for currency in ('EUR', 'USD')
+            for day in range(days)
+        ])
+        refresh_rollups(['EUR'], self.start_date, self.end_date)
+        return days
+
+    def test_choose_period_within_form_range(self):
+        # Формы ограничивают период 730 днями: недельные агрегаты
+        # должны использоваться уже для периодов от года
+        self.assertIsNone(choose_period(date(2023, 1, 1), date(2023, 6, 30)))
+        self.assertEqual(
+            choose_period(date(2022, 1, 1), date(2022, 12, 31)),
+            CurrencyRateRollup.WEEK
+        )
+        self.assertEqual(
+            choose_period(self.start_date, self.end_date),
+            CurrencyRateRollup.WEEK
+        )
+        self.assertEqual(
+            choose_period(date(2010, 1, 1), date(2023, 12, 31)),
+            CurrencyRateRollup.MONTH
+        )
+        # Запрошенное число точек важнее порога по умолчанию
+        self.assertIsNone(
+            choose_period(self.start_date, self.end_date, min_points=500)
+        )
+
+    def test_series_api_mean_uses_rollups(self):
+        self.add_rates()
+        query = {
+            'currencies': 'EUR', 'start_date': '2022-01-01',
+            'end_date': '2023-12-31', 'base_date': '2022-01-01',
+            'points': 60, 'method': 'mean'
+        }
+        with mock.patch(
+                'currency_app.views.rollup_relative_change_series',
+                wraps=rollup_relative_change_series) as rollup:
+            response = self.client.get(reverse('series_api'), query)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(rollup.call_count, 1)
+            self.assertEqual(
+                len(response.json()['series']['EUR']['values']), 60
+            )
+            # LTTB сохраняет точки исходного ряда - нужны дневные курсы
+            response = self.client.get(
+                reverse('series_api'), {**query, 'method': 'lttb'}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(rollup.call_count, 1)
+
+    def test_currency_without_rollups_uses_daily_rates(self):
+        start_date, end_date = self.start_date, self.end_date
+        days = self.add_rates()
+        series = load_currency_relative_changes(
+            ['EUR', 'USD'], start_date, end_date, start_date, None,
+            get_data_version()
+        )
+        # EUR - по недельным агрегатам, USD - по дневным курсам
+        self.assertEqual(len(series['EUR'][0]), 105)
+        self.assertEqual(len(series['USD'][0]), days)
+        self.assertEqual(series['USD'][1][0], 0)
+
+
+class DownsamplingTests(SimpleTestCase):
+    def test_lttb_keeps_endpoints_and_peaks(self):
+        x = np.arange(1000)
+        y = np.sin(x / 50)
+        y[500] = 10
+        index = lttb(x, y, 50)
+        self.assertEqual(len(index), 50)
+        self.assertEqual((index[0], index[-1]), (0, 999))
+        self.assertTrue((np.diff(index) > 0).all())
+        self.assertIn(500, index)
+        # Порог не меньше длины ряда - точки не прореживаются
+        self.assertEqual(len(lttb(x[:10], y[:10], 10)), 10)
+
+    def test_bucket_mean(self):
+        x = np.arange(10)
+        y = np.arange(10, dtype=np.float64)
+        dates, means = bucket_mean(x, y, 5)
+        self.assertEqual(dates.tolist(), [0, 2, 4, 6, 8])
+        self.assertEqual(means.tolist(), [0.5, 2.5, 4.5, 6.5, 8.5])
+        # Неравные корзины: 3, 3 и 4 точки
+        dates, means = bucket_mean(x, y, 3)
+        self.assertEqual(dates.tolist(), [0, 3, 6])
+        self.assertEqual(means.tolist(), [1, 4, 7.5])
+        self.assertEqual(len(bucket_mean(x, y, 10)[0]), 10)
+
+    def test_downsample_returns_dates(self):
+        dates = [date(2024, 1, 1) + timedelta(days=day) for day in range(30)]
+        for method in ('lttb', 'mean'):
+            sampled, values = downsample(dates, list(range(30)), 5, method)
+            self.assertEqual(len(sampled), 5)
+            self.assertEqual(len(values), 5)
+            self.assertEqual(sampled[0], date(2024, 1, 1))
+        self.assertEqual(downsample(dates, list(range(30)), None)[0], dates)
+
+
+class SeriesApiTests(TestCase):
+    def setUp(self):
+        DataVersion.forget()
+        get_rate_store().reset()
+        for series in (
+                rate_series, cross_rate_series,
+                relative_change_series, cross_relative_change_series):
+            series.cache_clear()
+        CurrencyRate.synchronize_currency_rates([
+            {
+                'date': date(2024, 1, 1) + timedelta(days=day),
+                'currency': currency, 'rate': rate + day, 'change': 0,
+                'currency_code': 1
+            }
+            for currency, rate in (('USD', 90), ('EUR', 100))
+            for day in range(10)
+        ])
+
+    def get(self, **params):
+        query = {
+            'currencies': 'USD', 'start_date': '2024-01-01',
+            'end_date': '2024-01-10', 'base_date': '2024-01-01'
+        }
+        query.update(params)
+        return self.client.get(reverse('series_api'), query)
+
+    def test_bad_pairs(self):
+        for pairs in ('EURUSD', 'EUR/EUR', 'EUR/US1'):
+            response = self.get(pairs=pairs)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('pairs', response.json()['errors'])
+
+    def test_start_after_end(self):
+        response = self.get(start_date='2024-01-10', end_date='2024-01-01')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('__all__', response.json()['errors'])
+
+    def test_no_currencies(self):
+        response = self.get(currencies='', pairs='')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('currencies', response.json()['errors'])
+
+    def test_columnar_payload(self):
+        response = self.get(kind='rate', pairs='EUR/USD')
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual(payload['kind'], 'rate')
+        self.assertIsNone(payload['base_date'])
+        self.assertEqual(
+            (payload['start_date'], payload['end_date']),
+            ('2024-01-01', '2024-01-10')
+        )
+        self.assertEqual(set(payload['series']), {'USD', 'EUR/USD'})
+        usd = payload['series']['USD']
+        self.assertEqual(set(usd), {'dates', 'values'})
+        self.assertEqual(usd['dates'][:2], ['2024-01-01', '2024-01-02'])
+        self.assertEqual(usd['values'][:2], [90, 91])
+        self.assertEqual(
+            payload['series']['EUR/USD']['values'][0], round(100 / 90, 6)
+        )
+
+    def test_relative_payload_with_points(self):
+        response = self.get(points=4)
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual(payload['kind'], 'relative')
+        self.assertEqual(payload['base_date'], '2024-01-01')
+        usd = payload['series']['USD']
+        self.assertEqual(len(usd['dates']), 4)
+        self.assertEqual(len(usd['values']), 4)
+        self.assertEqual(usd['values'][0], 0)
+        self.assertEqual(usd['dates'][-1], '2024-01-10')
+        self.assertEqual(usd['values'][-1], round(9 / 90 * 100, 4))
+
+
+def date_fields(name: str, value: date) -> dict:
+    """
+    Поля SelectDateWidget для POST-запроса формы.
+    """
+    return {
+        f'{name}_year': value.year,
+        f'{name}_month': value.month,
+        f'{name}_day': value.day
+    }
+
+
+class ViewTestCase(TestCase):
+    """
+    Курсы USD за 10 дней и страна с этой валютой; кэши процесса
+    и кэши Django очищаются перед каждым тестом.
+    """
+    def setUp(self):
+        DataVersion.forget()
+        get_rate_store().reset()
+        relative_change_series.cache_clear()
+        stored_relative_change_series.cache_clear()
+        cache.clear()
+        get_chart_cache().clear()
+        CurrencyTuple._process_cache = (None, [])
+        CountryCurrency.objects.create(
+            country='США', currency_name='USD', currency_code='USD',
+            currency_number=840
+        )
+        CurrencyRate.synchronize_currency_rates([
+            {
+                'date': date(2024, 1, 1) + timedelta(days=day),
+                'currency': 'USD', 'rate': 90 + day, 'change': 0,
+                'currency_code': 52148
+            }
+            for day in range(10)
+        ])
+        SyncParameter.objects.create(
+            param_name='base_date', param_value=date(2024, 1, 10)
+        )
+
+    def chart_data(self) -> dict:
+        return {
+            **date_fields('start_date', date(2024, 1, 1)),
+            **date_fields('end_date', date(2024, 1, 10)),
+            **date_fields('base_date', date(2024, 1, 1)),
+            'currency': ['USD']
+        }
+
+
+class AsyncViewTests(ViewTestCase):
+    async def test_index_get(self):
+        response = await self.async_client.get(reverse('index_async'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'currency_app/index.html')
+
+    async def test_index_post_queues_job(self):
+        response = await self.async_client.post(reverse('index_async'), {
+            **date_fields('start_date', date(2024, 1, 1)),
+            **date_fields('end_date', date(2024, 1, 10))
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'currency_app/success.html')
+        job = await SyncJob.objects.aget()
+        self.assertEqual(job.status, SyncJob.PENDING)
+        self.assertEqual(
+            (job.start_date, job.end_date), (date(2024, 1, 1), date(2024, 1, 10))
+        )
+
+    async def test_relative_changes_get(self):
+        response = await self.async_client.get(reverse('relative_changes_async'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['date'], date(2024, 1, 10))
+        self.assertIn(
+            'USD', dict(response.context['form'].fields['currency'].choices)
+        )
+
+    async def test_relative_changes_post_uses_chart_cache(self):
+        data = self.chart_data()
+
+        # График строится в потоке теста, без пула процессов
+        async def render(series):
+            return render_relative_changes(series)
+
+        with mock.patch(
+                'currency_app.views.render_relative_changes_async',
+                side_effect=render) as render_async:
+            first = await self.async_client.post(
+                reverse('relative_changes_async'), data
+            )
+            second = await self.async_client.post(
+                reverse('relative_changes_async'), data
+            )
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first.context['graphic'])
+        self.assertEqual(first.context['date'], date(2024, 1, 1))
+        # Повторный запрос отдаётся из кэша графиков
+        self.assertEqual(render_async.call_count, 1)
+        self.assertEqual(second.context['graphic'], first.context['graphic'])
+        dates, values = render_async.call_args.args[0]['USD']
+        self.assertEqual(len(dates), 10)
+        self.assertEqual(values[0], 0)
+
+
+class CacheInvalidationTests(ViewTestCase):
+    def test_rate_write_invalidates_chart(self):
+        key_args = ({'USD'}, date(2024, 1, 1), date(2024, 1, 10), date(2024, 1, 1))
+        with mock.patch(
+                'currency_app.views.render_relative_changes',
+                wraps=render_relative_changes) as render:
+            self.client.post(reverse('relative_changes'), self.chart_data())
+            self.client.post(reverse('relative_changes'), self.chart_data())
+            self.assertEqual(render.call_count, 1)
+            key = chart_cache_key(*key_args, get_data_version())
+            self.assertIsNotNone(get_chart_cache().get(key))
+
+            CurrencyRate.synchronize_currency_rates([{
+                'date': date(2024, 1, 10), 'currency': 'USD', 'rate': 180,
+                'change': 0, 'currency_code': 52148
+            }])
+            new_key = chart_cache_key(*key_args, get_data_version())
+            self.assertNotEqual(new_key, key)
+            self.assertIsNone(get_chart_cache().get(new_key))
+
+            self.client.post(reverse('relative_changes'), self.chart_data())
+        # После записи график строится заново по новым курсам
+        self.assertEqual(render.call_count, 2)
+        dates, values = render.call_args.args[0]['USD']
+        self.assertEqual(values[-1], 100)
+        self.assertIsNotNone(get_chart_cache().get(new_key))
+
+    def test_writes_invalidate_currency_codes(self):
+        def codes():
+            return [code for code, _ in CurrencyTuple().CURRENCY_CODES]
+
+        self.assertEqual(codes(), ['USD'])
+        # Пока версия данных не изменилась, список берётся из памяти
+        with self.assertNumQueries(0):
+            self.assertEqual(codes(), ['USD'])
+
+        CurrencyRate.synchronize_currency_rates([{
+            'date': date(2024, 1, 1), 'currency': 'EUR', 'rate': 100,
+            'change': 0, 'currency_code': 52170
+        }])
+        # Курсы EUR есть, но страны с этой валютой ещё нет
+        self.assertEqual(codes(), ['USD'])
+
+        CountryCurrency.synchronize_country_currencies([{
+            'country': 'Еврозона', 'currency_name': 'EUR',
+            'currency_code': 'EUR', 'currency_number': 978
+        }])
+        self.assertEqual(sorted(codes()), ['EUR', 'USD'])
+
+
+class MetricsServerTests(SimpleTestCase):
+    def test_worker_metrics_server(self):
+        server = start_metrics_server(0, '127.0.0.1')
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        with span('fetch'):
+            pass
+        response = requests.get(
+            f'http://127.0.0.1:{server.server_port}/metrics', timeout=5
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('currency_app_stage_seconds_count{stage="fetch"}', response.text)
+
+
+class RateStoreTests(TestCase):
+    def setUp(self):
+        DataVersion.forget()
+        self.store = get_rate_store()
+        self.store.reset()
+        self.addCleanup(self.store.reset)
+
+    def add_rate(self, rate_date, rate):
+        CurrencyRate.synchronize_currency_rates([{
+            'date': rate_date, 'currency': 'USD', 'rate': rate,
+            'change': 0, 'currency_code': 52148
+        }])
+
+    def test_late_commit_is_read(self):
+        self.add_rate(date(2024, 3, 1), 90)
+        watermark = CurrencyRate.objects.get().upload_time
+        self.assertEqual(self.store.slice('USD')[1].tolist(), [900000])
+        # Строка параллельной транзакции: время поставлено раньше
+        # отметки хранилища, а зафиксирована строка позже
+        CurrencyRate.objects.create(
+            date=date(2024, 3, 4), currency='USD', rate=91, change=0,
+            currency_code=52148
+        )
+        CurrencyRate.objects.filter(date=date(2024, 3, 4)).update(
+            upload_time=watermark - timedelta(minutes=1)
+        )
+        DataVersion.bump()
+        self.assertEqual(self.store.slice('USD')[1].tolist(), [900000, 910000])
+
+    def test_rate_as_of(self):
+        self.add_rate(date(2020, 1, 9), 60)
+        self.add_rate(date(2020, 1, 10), 61)
+        self.assertEqual(self.store.rate_as_of('USD', date(2020, 1, 12)), 610000)
+        # Новогодние праздники перед первым курсом
+        self.assertEqual(self.store.rate_as_of('USD', date(2020, 1, 1)), 600000)
+        # Задолго до первого курса курса нет
+        self.assertIsNone(self.store.rate_as_of('USD', date(2015, 1, 1)))
+        self.assertIsNone(self.store.rate_as_of('EUR', date(2020, 1, 12)))
+
+    def test_cross_rate_base_before_first_rate(self):
+        self.add_rate(date(2020, 1, 9), 60)
+        self.add_rate(date(2020, 1, 10), 61)
+        cross_relative_change_series.cache_clear()
+
+        def changes(base_date):
+            return cross_relative_change_series(
+                (('USD', 'RUB'),), base_date, date(2020, 1, 1),
+                date(2020, 1, 31), get_data_version()
+            )
+        self.assertEqual(changes(date(2015, 1, 1)), {})
+        self.assertEqual(changes(date(2020, 1, 1)), {
+            'USD/RUB': ([date(2020, 1, 9), date(2020, 1, 10)], [0.0, 1.6667])
+        })
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        SyncParameter.objects.create(
+            param_name='base_date', param_value=date(2024, 3, 1)
+        )
+        for currency, rate in (('EUR', 100), ('USD', 90)):
+            for day, change in ((1, '0.0000'), (4, '1.2500')):
+                CurrencyRate.objects.create(
+                    date=date(2024, 3, day), currency=currency, rate=rate,
+                    change=0, currency_code=1
+                )
+                RelativeChange.objects.create(
+                    date=date(2024, 3, day), currency=currency,
+                    relative_change=Decimal(change)
+                )
+
+    def export(self, dataset, **params):
+        response = self.client.get(f'/export/{dataset}/', params)
+        content = b''.join(response.streaming_content)
+        return response, content
+
+    def test_relative_changes_csv(self):
+        response, content = self.export(
+            'relative_changes', currencies='usd', start_date='2024-03-02'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(content.decode().splitlines(), [
+            'date,currency,relative_change,base_date',
+            '2024-03-04,USD,1.2500,2024-03-01',
+        ])
+
+    def test_rates_csv(self):
+        response, content = self.export('rates')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = content.decode().splitlines()
+        self.assertEqual(lines[0], 'date,currency,rate,change,currency_code')
+        self.assertEqual(lines[1], '2024-03-01,EUR,100.0000,0.0000,1')
+        self.assertEqual(len(lines), 5)
+
+    @skipUnless(parquet_available(), 'pyarrow не установлен')
+    def test_relative_changes_parquet(self):
+        import pyarrow.parquet as pq
+
+        response, content = self.export('relative_changes', format='parquet')
+        self.assertEqual(response.status_code, 200)
+        table = pq.read_table(io.BytesIO(content))
+        self.assertEqual(table.num_rows, 4)
+        self.assertEqual(table.to_pylist()[1], {
+            'date': date(2024, 3, 4), 'currency': 'EUR',
+            'relative_change': Decimal('1.2500'), 'base_date': date(2024, 3, 1)
+        })
+
+    def test_parquet_without_pyarrow(self):
+        with mock.patch(
+                'currency_app.views.parquet_available', return_value=False):
+            response = self.client.get('/export/rates/', {'format': 'parquet'})
+        self.assertEqual(response.status_code, 501)
+
+    def test_invalid_request(self):
+        self.assertEqual(self.client.get('/export/unknown/').status_code, 404)
+        response = self.client.get('/export/rates/', {'format': 'xlsx'})
+        self.assertEqual(response.status_code, 400)
@@ -1,5 +1,6 @@
 from django.urls import path
 from . import views
+from .metrics import metrics_view
 
 urlpatterns = [
     path('', views.index, name='index'),
@@ -8,4 +9,19 @@ urlpatterns = [
         views.relative_changes_view,
         name='relative_changes'
         ),
+    # Асинхронные варианты страниц для запуска под ASGI-сервером
+    path('async/', views.index_async, name='index_async'),
+    path(
+        'async/relative-changes/',
+        views.relative_changes_view_async,
+        name='relative_changes_async'
+        ),
+    path('metrics/', metrics_view, name='metrics'),
+    path('api/series/', views.series_api, name='series_api'),
+    path('export/<str:dataset>/', views.export_view, name='export'),
+    path(
+        'jobs/<int:job_id>/',
+        views.sync_job_status,
+        name='sync_job_status'
+        ),
 ]
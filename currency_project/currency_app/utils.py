@@ -105,103 +105,751 @@
 
 #     return relative_changes
 
-from datetime import datetime
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+from urllib.parse import urlsplit
+import numpy as np
 import requests
-from bs4 import BeautifulSoup
-from .models import CurrencyRate
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.db.models import FloatField, Max
+from django.db.models.functions import Cast
+from .bulk import get_batch_size
+from .cache import get_data_version
+from .http_cache import HTTPCache, get_http_cache, get_ttl
+from .metrics import timed
+from .models import CurrencyRate, FetchedPeriod
+from .parsers import (
+    iter_finmarket_currencies,
+    iter_finmarket_rates,
+    iter_iban_currencies
+)
+from .registry import get_currency_codes
 
-class CurrencyFetcher:
+
+def response_encoding(response) -> str | None:
+    """
+    Кодировка из заголовка Content-Type. Если сервер её не указал,
+    возвращается None и кодировка определяется по meta самой страницы.
     """
-    Класс для синхронизации данных по курсам валют
+    if 'charset=' in response.headers.get('content-type', '').lower():
+        return response.encoding
+    return None
+
+
+def create_http_session(
+        pool_size: int = 10,
+        retries: int = 3,
+        backoff_factor: float = 0.5
+        ) -> requests.Session:
     """
+    Создание HTTP-сессии с keep-alive соединениями.
+    Пул соединений переиспользуется между запросами, а временные ошибки
+    (5xx, 429, обрывы соединения) повторяются с экспоненциальной задержкой.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class HostLimiter:
+    """
+    Ограничение числа одновременных запросов к одному хосту
+    и, если задан rate, частоты запросов к нему (запросов в секунду).
+    При rate запросы к хосту разносятся по времени не чаще 1 / rate,
+    поэтому загрузка сотни валют не превращается в залп запросов.
+    """
+    def __init__(self, limit: int, rate: float | None = None):
+        self.limit = limit
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._semaphores = defaultdict(
+            lambda: threading.BoundedSemaphore(self.limit)
+        )
+        self._next_slot = {}
+
+    @contextmanager
+    def for_url(self, url: str):
+        host = urlsplit(url).netloc
+        with self._lock:
+            semaphore = self._semaphores[host]
+        with semaphore:
+            self.wait_turn(host)
+            yield
+
+    def wait_turn(self, host: str):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + 1 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class BaseFetcher:
     """
-    Так как id для валют с двух сайтов не совпадают,
-    то задаем требуемые id вручную. Не совсем адаптивно :(
+    Общая часть загрузчиков: HTTP-сессия, ограничение запросов к хосту
+    и дисковый кэш ответов (см. http_cache.HTTPCache).
     """
-    CURRENCY_CODES = {
-        'USD': 52148,
-        'EUR': 52170,
-        'GBP': 52146,
-        'TRY': 52158,
-        'JPY': 52246,
-        'INR': 52238,
-        'CNY': 52207
-    }
+    TIMEOUT = (5, 30)
+    PER_HOST_LIMIT = 4
+    RATE_LIMIT = 10
+    POOL_SIZE = 10
 
-    def __init__(self, start_date: datetime, end_date: datetime):
+    def __init__(
+            self,
+            per_host_limit: int | None = None,
+            timeout: tuple[float, float] | None = None,
+            session: requests.Session | None = None,
+            http_cache: HTTPCache | None = None,
+            rate_limit: float | None = None
+            ):
+        self.timeout = timeout or self.TIMEOUT
+        # rate_limit=0 отключает ограничение частоты запросов
+        self.host_limiter = HostLimiter(
+            per_host_limit or self.PER_HOST_LIMIT,
+            self.RATE_LIMIT if rate_limit is None else rate_limit
+        )
+        self.session = session or create_http_session(pool_size=self.POOL_SIZE)
+        self.http_cache = http_cache or get_http_cache()
+
+    @timed('fetch')
+    def get(self, url: str, ttl: float | None = 0):
+        # Свежая копия из кэша не занимает очередь запросов к хосту
+        if self.http_cache is not None:
+            cached = self.http_cache.fresh(url, ttl)
+            if cached is not None:
+                return cached
+        with self.host_limiter.for_url(url):
+            if self.http_cache is not None:
+                return self.http_cache.get(self.session, url, ttl, self.timeout)
+            response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+    @timed('parse')
+    def parse(self, response, parser) -> list:
+        """
+        Разбор ответа; для ответа из кэша берётся сохранённый результат.
+        """
+        if self.http_cache is not None:
+            return self.http_cache.parsed(response, parser)
+        return parser(response)
+
+
+class CurrencyFetcher(BaseFetcher):
+    """
+    Класс для синхронизации данных по курсам валют.
+    Курсы по разным валютам загружаются параллельно через общую сессию;
+    max_workers=1 сохраняет последовательный режим.
+    plan - необязательный план загрузки {валюта: [(начало, конец), ...]},
+    см. SyncPlanner. Без плана загружается весь период по всем валютам.
+    currencies - {код ISO: идентификатор на finmarket.ru}, по умолчанию
+    активные валюты реестра UpstreamCurrency.
+    completed_tasks - выполненные запросы (валюта, начало, конец, строк)
+    для SyncPlanner.record.
+    """
+    MAX_WORKERS = 7
+    QUEUE_SIZE = 8
+    MAX_RANGE_DAYS = 366
+    BASE_URL = 'https://www.finmarket.ru/currency/rates/'
+
+    def __init__(
+            self,
+            start_date: datetime,
+            end_date: datetime,
+            max_workers: int | None = None,
+            per_host_limit: int | None = None,
+            timeout: tuple[float, float] | None = None,
+            session: requests.Session | None = None,
+            plan: dict[str, list[tuple[date, date]]] | None = None,
+            http_cache: HTTPCache | None = None,
+            currencies: dict[str, int] | None = None,
+            rate_limit: float | None = None
+            ):
         self.start_date = start_date
         self.end_date = end_date
+        self.plan = plan
+        self.currencies = (
+            get_currency_codes() if currencies is None else currencies
+        )
+        self.max_workers = max_workers or self.MAX_WORKERS
+        self.completed_tasks = []
+        super().__init__(
+            per_host_limit=per_host_limit,
+            timeout=timeout,
+            session=session or create_http_session(pool_size=self.max_workers),
+            http_cache=http_cache,
+            rate_limit=rate_limit
+        )
+
+    def build_url(self, code: int, start_date: date, end_date: date) -> str:
+        return (
+            f"{self.BASE_URL}"
+            f"?id=10148&pv=1&cur={code}"
+            f"&bd={start_date.day}&bm={start_date.month}&by={start_date.year}"
+            f"&ed={end_date.day}&em={end_date.month}&ey={end_date.year}"
+            f"#archive"
+        )
+
+    def fetch_currency(
+            self,
+            currency: str,
+            code: int,
+            start_date: date,
+            end_date: date
+            ) -> list[dict]:
+        """
+        Загрузка и разбор архива курсов одной валюты за период.
+        """
+        # Архив за прошедший период уже не меняется и кэшируется бессрочно
+        ttl = None if end_date < date.today() else get_ttl('finmarket')
+        response = self.get(self.build_url(code, start_date, end_date), ttl)
+        # За период без торговых дней таблица на странице отсутствует,
+        # тогда строк просто нет.
+        rows = self.parse(response, lambda response: list(iter_finmarket_rates(
+            response.content, response_encoding(response)
+        )))
+        return [
+            {
+                'date': rate_date,
+                'currency': currency,
+                'rate': rate,
+                'change': change,
+                'currency_code': code
+            }
+            for rate_date, rate, change in rows
+        ]
+
+    def tasks(self) -> list[tuple[str, int, date, date]]:
+        """
+        Список запросов (валюта, id, начало, конец) согласно плану.
+        """
+        tasks = []
+        for currency, code in self.currencies.items():
+            if self.plan is None:
+                ranges = [(self.start_date, self.end_date)]
+            else:
+                ranges = self.plan.get(currency, [])
+            for start_date, end_date in ranges:
+                # Длинный период делится на части, чтобы размер одной
+                # страницы (и память на её разбор) не рос с периодом
+                while start_date <= end_date:
+                    part_end = min(
+                        start_date + timedelta(days=self.MAX_RANGE_DAYS - 1),
+                        end_date
+                    )
+                    tasks.append((currency, code, start_date, part_end))
+                    start_date = part_end + timedelta(days=1)
+        return tasks
 
     def fetch_currency_rates(self) -> list[dict]:
         all_data = []
-        for currency, code in self.CURRENCY_CODES.items():
-            url = (
-                f"https://www.finmarket.ru/currency/rates/"
-                f"?id=10148&pv=1&cur={code}"
-                f"&bd={self.start_date.day}&bm={self.start_date.month}&by={self.start_date.year}"
-                f"&ed={self.end_date.day}&em={self.end_date.month}&ey={self.end_date.year}"
-                f"#archive"
-            )
-            response = requests.get(url)
-            soup = BeautifulSoup(response.content, 'lxml')
-            table = soup.find('table', class_='karramba')
-            for row in table.find('tbody').find_all('tr'):
-                cols = row.find_all('td')
-                date = datetime.strptime(cols[0].text.strip(), '%d.%m.%Y').date()
-                rate = float(cols[2].text.strip().replace(',', '.'))
-                change = float(cols[3].text.strip().replace(',', '.'))
-                currency_code = code
-                all_data.append({
-                    'date': date,
-                    'currency': currency,
-                    'rate': rate,
-                    'change': change,
-                    'currency_code': currency_code
-                })
+        for batch in self.iter_currency_rate_batches():
+            all_data.extend(batch)
         return all_data
 
+    def iter_currency_rate_batches(
+            self,
+            batch_size: int | None = None,
+            queue_size: int | None = None
+            ):
+        """
+        Потоковая загрузка: строки выдаются пакетами по batch_size,
+        как только готова любая из страниц, поэтому запись в базу идёт
+        параллельно с загрузкой остальных валют. Очередь между
+        загрузчиками и потребителем ограничена queue_size пакетами:
+        если запись отстаёт, загрузчики ждут (обратное давление),
+        и объём памяти не растёт с длиной периода и числом валют.
+        """
+        batch_size = get_batch_size(batch_size)
+        tasks = self.tasks()
+        if not tasks:
+            return
+        batches = queue.Queue(maxsize=queue_size or self.QUEUE_SIZE)
+        stop = threading.Event()
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce(task):
+            try:
+                rows = self.fetch_currency(*task)
+                for start in range(0, len(rows), batch_size):
+                    if not put(rows[start:start + batch_size]):
+                        return
+                currency, _, start_date, end_date = task
+                self.completed_tasks.append(
+                    (currency, start_date, end_date, len(rows))
+                )
+            except Exception as error:
+                put(error)
+
+        def finish(futures):
+            wait(futures)
+            put(None)
+
+        executor = ThreadPoolExecutor(
+            max_workers=min(self.max_workers, len(tasks))
+        )
+        try:
+            futures = [executor.submit(produce, task) for task in tasks]
+            threading.Thread(target=finish, args=(futures,), daemon=True).start()
+            pending = []
+            while True:
+                item = batches.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                pending.extend(item)
+                while len(pending) >= batch_size:
+                    yield pending[:batch_size]
+                    pending = pending[batch_size:]
+            if pending:
+                yield pending
+        finally:
+            stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+class SyncPlanner:
+    """
+    Определение периодов, курсов за которые ещё нет в базе.
+    Загруженными считаются периоды из FetchedPeriod (выходные и праздники
+    внутри них уже учтены) и даты, на которые есть курс в CurrencyRate.
+    Пропуски, разделённые не более чем MERGE_GAP загруженными днями,
+    объединяются в один период, чтобы не дробить запросы по выходным.
+    Всё берётся двумя запросами.
+    """
+    MERGE_GAP = 31
+
+    def __init__(self, start_date: date, end_date: date, currencies):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.currencies = list(currencies)
+
+    def load_coverage(self) -> dict[str, list[tuple[date, date]]]:
+        coverage = {currency: [] for currency in self.currencies}
+        periods = FetchedPeriod.objects.filter(
+            currency__in=self.currencies,
+            start_date__lte=self.end_date,
+            end_date__gte=self.start_date
+        ).values_list('currency', 'start_date', 'end_date')
+        for currency, start_date, end_date in periods:
+            coverage[currency].append((start_date, end_date))
+        rows = CurrencyRate.objects.filter(
+            currency__in=self.currencies,
+            date__range=[self.start_date, self.end_date]
+        ).values_list('currency', 'date')
+        for currency, rate_date in rows.iterator():
+            coverage[currency].append((rate_date, rate_date))
+        return coverage
+
+    def missing_ranges(
+            self,
+            covered: list[tuple[date, date]]
+            ) -> list[tuple[date, date]]:
+        """
+        Пропущенные подпериоды для списка загруженных периодов.
+        """
+        one_day = timedelta(days=1)
+        gaps = []
+        cursor = self.start_date
+        for start_date, end_date in sorted(covered):
+            if start_date > cursor:
+                gaps.append((cursor, start_date - one_day))
+            cursor = max(cursor, end_date + one_day)
+        if cursor <= self.end_date:
+            gaps.append((cursor, self.end_date))
+        missing = []
+        for start_date, end_date in gaps:
+            if missing and (start_date - missing[-1][1]).days <= self.MERGE_GAP:
+                missing[-1] = (missing[-1][0], end_date)
+            else:
+                missing.append((start_date, end_date))
+        return missing
+
+    def plan(self) -> dict[str, list[tuple[date, date]]]:
+        return {
+            currency: self.missing_ranges(covered)
+            for currency, covered in self.load_coverage().items()
+        }
+
+    @staticmethod
+    def record(tasks: list[tuple[str, date, date, int]]):
+        """
+        Сохранение загруженных периодов (валюта, начало, конец, строк),
+        см. CurrencyFetcher.completed_tasks; вызывается после записи
+        курсов в базу. Период без строк сохраняется, только если в нём
+        нет рабочих дней: иначе пустой ответ может оказаться страницей
+        ошибки, и период нужно загрузить заново. Дни начиная
+        с сегодняшнего не сохраняются: курсы на них ещё могут появиться.
+        """
+        last_day = date.today() - timedelta(days=1)
+        FetchedPeriod.objects.bulk_create([
+            FetchedPeriod(
+                currency=currency,
+                start_date=start_date,
+                end_date=min(end_date, last_day)
+            )
+            for currency, start_date, end_date, rows in tasks
+            if start_date <= last_day and (
+                rows or not np.busday_count(
+                    start_date, min(end_date, last_day) + timedelta(days=1)
+                )
+            )
+        ])
+
+
+class CountryCurrencyFetcher(BaseFetcher):
+    """
+    Загрузка списка валют стран. Список меняется редко, поэтому
+    страница кэшируется на срок HTTP_CACHE['TTL']['iban'].
+    """
+    URL = 'https://www.iban.ru/currency-codes'
 
-class CountryCurrencyFetcher:
     def fetch_country_currencies(self) -> list[dict]:
-        url = "https://www.iban.ru/currency-codes"
-        response = requests.get(url)
-        soup = BeautifulSoup(response.content, 'lxml')
-        table = soup.find('table', class_='table table-bordered downloads tablesorter')
-        data = []
-
-        for row in table.find('tbody').find_all('tr'):
-            cols = row.find_all('td')
-            country = cols[0].text.strip()
-            currency_name = cols[1].text.strip()
-            currency_code = cols[2].text.strip()
-            currency_number = int(cols[3].text.strip()) if cols[3].text.strip() != '' else 0
-            data.append({
+        response = self.get(self.URL, get_ttl('iban'))
+        rows = self.parse(response, lambda response: list(iter_iban_currencies(
+            response.content, response_encoding(response)
+        )))
+        return [
+            {
                 'country': country,
                 'currency_name': currency_name,
                 'currency_code': currency_code,
                 'currency_number': currency_number
-            })
-        return data
+            }
+            for country, currency_name, currency_code, currency_number in rows
+        ]
+
+
+class CurrencyRegistryFetcher(BaseFetcher):
+    """
+    Загрузка списка валют finmarket.ru для реестра UpstreamCurrency:
+    идентификаторы берутся из списка валют на странице курсов.
+    """
+    URL = CurrencyFetcher.BASE_URL
+
+    def fetch_upstream_currencies(self) -> list[dict]:
+        response = self.get(self.URL, get_ttl('finmarket_registry'))
+        rows = self.parse(response, lambda response: list(
+            iter_finmarket_currencies(
+                response.content, response_encoding(response)
+            )
+        ))
+        return [
+            {
+                'currency_code': currency_code,
+                'upstream_id': upstream_id,
+                'name': name
+            }
+            for upstream_id, currency_code, name in rows
+        ]
+
+
+RATE_SCALE = 10 ** 4
+# Дата раньше первого курса валюты считается праздниками перед ним
+# (например, новогодними), только если до первого курса не больше
+# HOLIDAY_TOLERANCE дней; иначе курса на эту дату нет.
+HOLIDAY_TOLERANCE = np.timedelta64(14, 'D')
+
+
+def to_scaled(values) -> np.ndarray:
+    """
+    Перевод значений с 4 знаками после запятой в целые числа (x 10^4),
+    чтобы дальнейшие вычисления были точными, как с Decimal.
+    """
+    return np.rint(np.asarray(values, dtype=np.float64) * RATE_SCALE).astype(np.int64)
+
+
+def from_scaled(value) -> Decimal:
+    return Decimal(int(value)).scaleb(-4)
+
+
+def relative_change_scaled(rates: np.ndarray, base: np.ndarray) -> np.ndarray:
+    """
+    Относительное изменение (rate - base) / base * 100 в процентах,
+    в целых x 10^4 с банковским округлением - так же, как значение
+    Decimal округляется при сохранении в DecimalField(decimal_places=4).
+    """
+    numerator = (rates - base) * 100 * RATE_SCALE
+    quotient = numerator // base
+    remainder = numerator - quotient * base
+    twice = remainder * 2
+    round_up = (twice > base) | ((twice == base) & (quotient % 2 == 1))
+    return quotient + round_up
+
+
+class RateStore:
+    """
+    Курсы валют в памяти процесса для расчётов и графиков без обращения
+    к ORM. Для каждой валюты хранятся отсортированный массив дат
+    (datetime64[D]) и массив курсов в целых x 10^4 (int64), то есть
+    16 байт на строку вместо объекта модели с Decimal.
+    Курсы загружаются при первом обращении. После изменения версии
+    данных (см. cache.get_data_version) дочитываются только строки
+    с upload_time не раньше сохранённой отметки минус OVERLAP.
+    upload_time ставится приложением до фиксации транзакции, поэтому
+    параллельная запись (sync_worker --threads N, PostgreSQL) может
+    зафиксировать строки со временем раньше уже сохранённой отметки;
+    перекрытие дочитывает их повторно. Удалённые из базы строки
+    не отслеживаются - для них есть reset().
+    """
+    CHUNK_SIZE = 5000
+    OVERLAP = timedelta(minutes=5)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+        self._calendar = None
+        self._watermark = None
+        self._version = None
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+            self._calendar = None
+            self._watermark = None
+            self._version = None
+
+    def ensure_fresh(self):
+        version = get_data_version()
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self.load()
+                self._version = version
+
+    def load(self):
+        # Отметка берётся до чтения строк: строки, записанные во время
+        # чтения, попадут в следующее обновление. Повторно прочитанные
+        # строки просто заменяют прежние значения.
+        watermark = CurrencyRate.objects.aggregate(
+            last=Max('upload_time')
+        )['last']
+        rows = CurrencyRate.objects.annotate(
+            rate_value=Cast('rate', FloatField())
+        )
+        if self._watermark is not None:
+            rows = rows.filter(upload_time__gte=self._watermark - self.OVERLAP)
+        rows = rows.order_by('currency', 'date').values_list(
+            'currency', 'date', 'rate_value'
+        )
+        series = dict(self._series)
+        # Строки упорядочены по валюте: списки Python держатся только
+        # для одной валюты и сразу переводятся в массивы
+        for currency, group in groupby(
+                rows.iterator(chunk_size=self.CHUNK_SIZE), key=itemgetter(0)):
+            _, dates, rates = zip(*group)
+            new_dates = np.array(dates, dtype='datetime64[D]')
+            new_rates = to_scaled(rates)
+            if currency in series:
+                new_dates, new_rates = self.merge(
+                    *series[currency], new_dates, new_rates
+                )
+            series[currency] = (new_dates, new_rates)
+        self._series = series
+        self._calendar = None
+        if watermark is not None:
+            self._watermark = watermark
+
+    @staticmethod
+    def merge(dates, rates, new_dates, new_rates):
+        """
+        Объединение рядов; для совпадающих дат остаётся новое значение.
+        """
+        dates = np.concatenate([dates, new_dates])
+        rates = np.concatenate([rates, new_rates])
+        order = np.argsort(dates, kind='stable')
+        dates, rates = dates[order], rates[order]
+        last = np.append(dates[1:] != dates[:-1], True)
+        return dates[last], rates[last]
+
+    def currencies(self) -> list[str]:
+        self.ensure_fresh()
+        return sorted(self._series)
+
+    def slice(
+            self,
+            currency: str,
+            start_date: date | None = None,
+            end_date: date | None = None
+            ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Даты и курсы (x 10^4) валюты за период; границы находятся
+        двоичным поиском, возвращаются срезы без копирования.
+        """
+        self.ensure_fresh()
+        dates, rates = self._series.get(
+            currency,
+            (np.empty(0, dtype='datetime64[D]'), np.empty(0, dtype=np.int64))
+        )
+        left = 0 if start_date is None else np.searchsorted(
+            dates, np.datetime64(start_date, 'D'), side='left'
+        )
+        right = len(dates) if end_date is None else np.searchsorted(
+            dates, np.datetime64(end_date, 'D'), side='right'
+        )
+        return dates[left:right], rates[left:right]
+
+    def rate_as_of(self, currency: str, value: date) -> int | None:
+        """
+        Курс (x 10^4), действовавший на дату: последний известный курс
+        не позже неё (в выходные и праздники - курс предыдущего торгового
+        дня). Если курсов раньше даты нет, первый известный курс
+        берётся, только если он не дальше HOLIDAY_TOLERANCE от даты.
+        None - курса на дату нет.
+        """
+        dates, rates = self.slice(currency)
+        if not len(dates):
+            return None
+        value = np.datetime64(value, 'D')
+        index = np.searchsorted(dates, value, side='right')
+        if index == 0:
+            if dates[0] - value > HOLIDAY_TOLERANCE:
+                return None
+            return int(rates[0])
+        return int(rates[index - 1])
+
+    def calendar(self) -> 'TradingCalendar':
+        """
+        Торговый календарь: все даты, на которые есть курс хотя бы
+        одной валюты.
+        """
+        self.ensure_fresh()
+        calendar = self._calendar
+        if calendar is None:
+            days = [dates for dates, _ in self._series.values()]
+            calendar = TradingCalendar(
+                np.unique(np.concatenate(days)) if days
+                else np.empty(0, dtype='datetime64[D]')
+            )
+            self._calendar = calendar
+        return calendar
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            dates.nbytes + rates.nbytes for dates, rates in self._series.values()
+        )
+
+    @property
+    def rows(self) -> int:
+        return sum(len(dates) for dates, _ in self._series.values())
+
+
+class TradingCalendar:
+    """
+    Торговые дни (отсортированный массив datetime64[D]) и поиск
+    на них двоичным поиском, сразу для массива дат.
+    """
+    def __init__(self, days: np.ndarray):
+        self.days = days
+
+    def between(self, start_date: date, end_date: date) -> np.ndarray:
+        left = np.searchsorted(self.days, np.datetime64(start_date, 'D'))
+        right = np.searchsorted(
+            self.days, np.datetime64(end_date, 'D'), side='right'
+        )
+        return self.days[left:right]
+
+    def as_of(self, values) -> np.ndarray:
+        """
+        Для каждой даты - последний торговый день не позже неё;
+        для дат раньше первого торгового дня - первый торговый день.
+        """
+        values = np.asarray(values, dtype='datetime64[D]')
+        if not len(self.days):
+            return values
+        index = np.searchsorted(self.days, values, side='right') - 1
+        return self.days[np.maximum(index, 0)]
+
+
+def forward_fill(
+        dates: np.ndarray,
+        values: np.ndarray,
+        targets: np.ndarray
+        ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Значения ряда (dates, values) на даты targets: для каждой даты
+    берётся последнее известное значение не позже неё.
+    Возвращает (значения, маска дат, для которых значение известно).
+    """
+    if not len(dates):
+        return np.zeros(len(targets), dtype=values.dtype), np.zeros(len(targets), dtype=bool)
+    index = np.searchsorted(dates, targets, side='right') - 1
+    known = index >= 0
+    return values[np.maximum(index, 0)], known
+
+
+_rate_store = RateStore()
+
+
+def get_rate_store() -> RateStore:
+    return _rate_store
 
 
 class RelativeChangeCalculator:
+    """
+    Расчёт относительного изменения курсов к базовой дате.
+    Курсы берутся из RateStore и пересчитываются векторно.
+    Базой служит курс, действовавший на базовую дату (RateStore.rate_as_of),
+    поэтому дата может быть выходным или праздничным днём.
+    """
     def __init__(self, base_date: datetime):
         self.base_date = base_date
 
+    @timed('relative_change_calculation')
     def calculate_relative_changes(self) -> list[dict]:
-        base_rates = CurrencyRate.objects.filter(date=self.base_date)
+        base_date = self.base_date
+        if isinstance(base_date, datetime):
+            base_date = base_date.date()
+        store = get_rate_store()
         relative_changes = []
-
-        for base_rate in base_rates:
-            currency = base_rate.currency
-            rates = CurrencyRate.objects.filter(currency=currency)
-            for rate in rates:
-                relative_change = (rate.rate - base_rate.rate) / base_rate.rate * 100
-                relative_changes.append({
-                    'date': rate.date,
+        for currency in store.currencies():
+            base = store.rate_as_of(currency, base_date)
+            if not base:
+                continue
+            dates, rates = store.slice(currency)
+            changes = relative_change_scaled(rates, base)
+            relative_changes.extend(
+                {
+                    'date': rate_date,
                     'currency': currency,
-                    'relative_change': relative_change,
+                    'relative_change': from_scaled(change),
                     'relative_date': self.base_date
-                })
-
-        return relative_changes
\ No newline at end of file
+                }
+                for rate_date, change in zip(dates.astype(object), changes)
+            )
+        return relative_changes
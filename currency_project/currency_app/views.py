@@ -1,42 +1,72 @@
-from django.shortcuts import render  # type:ignore
-from .forms import DateRangeForm, RelativeChangeForm
-from .utils import (
-    CurrencyFetcher,
-    CountryCurrencyFetcher,
-    RelativeChangeCalculator
-    )
-from .models import (
-    CurrencyRate,
-    CountryCurrency,
-    SyncParameter,
-    RelativeChange
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render  # type:ignore
+from django.views.decorators.http import require_GET
+from .charts import render_relative_changes, render_relative_changes_async
+from .downsampling import downsample
+from .export import (
+    DATASETS,
+    export_rows,
+    iter_csv,
+    iter_parquet,
+    parquet_available
+)
+from .forms import (
+    DateRangeForm,
+    ExportQueryForm,
+    RelativeChangeForm,
+    SeriesQueryForm
+)
+from .cache import chart_cache_key, get_chart_cache, get_data_version
+from .rollups import choose_period
+from .series import (
+    cross_rate_series,
+    cross_relative_change_series,
+    pair_label,
+    rate_series,
+    relative_change_series,
+    rollup_relative_change_series,
+    stored_relative_change_series
 )
-import matplotlib.pyplot as plt  # type:ignore
-import io
-import base64
-import os
-from django.conf import settings
+from .metrics import timed
+from .models import CountryCurrency, SyncJob, SyncParameter
+from django.core.cache import cache
+from django.db import connection
 
 
 class CurrencyTuple:
-    """Для получения всех стран, валюты для которых у нас имеются"""
+    """
+    Для получения всех стран, валюты для которых у нас имеются.
+    Список хранится в памяти процесса и в кэше Django под текущей версией
+    данных (см. cache.get_data_version), поэтому запрос к базе
+    выполняется только после синхронизации.
+    """
+    CACHE_KEY = 'currency_app:currency_choices:{version}'
+    _process_cache = (None, [])
 
     def __init__(self):
         self.currency_tuples = []
 
     @staticmethod
-    def check_sqlite_db_exists():
-        db_path = settings.DATABASES['default']['NAME']
-        return os.path.exists(db_path)
+    def check_db_exists():
+        """
+        Проверка, что таблицы уже созданы (manage.py migrate);
+        работает для любой базы, а не только для файла SQLite.
+        """
+        with connection.cursor() as cursor:
+            tables = connection.introspection.table_names(cursor)
+        return CountryCurrency._meta.db_table in tables
 
     def load_currency_data(self):
-        # Выполнение запроса к базе данных только при вызове этого метода
+        # Выполнение запроса к базе данных только при вызове этого метода.
+        # EXISTS проверяет наличие курсов по индексу (currency, date)
+        # вместо соединения со всеми строками CurrencyRate.
         currency_data = CountryCurrency.objects.raw(
-            'SELECT DISTINCT '
+            'SELECT '
             'cac.id, cac.country, cac.currency_code, cac.currency_name '
             'from currency_app_countrycurrency cac '
-            'join currency_app_currencyrate cac2 '
-            'on cac.currency_code = cac2.currency '
+            'where exists (select 1 from currency_app_currencyrate cac2 '
+            'where cac2.currency = cac.currency_code) '
             'order by cac.currency_name'
         )
         for data in currency_data:
@@ -48,61 +78,177 @@ class CurrencyTuple:
 
     @property
     def CURRENCY_CODES(self):
-        if not self.currency_tuples and self.check_sqlite_db_exists():
-            self.load_currency_data()
+        if self.currency_tuples:
+            return self.currency_tuples
+        version = get_data_version()
+        cached_version, currency_tuples = CurrencyTuple._process_cache
+        if cached_version != version:
+            key = self.CACHE_KEY.format(version=version)
+            currency_tuples = cache.get(key)
+            if currency_tuples is None:
+                if not self.check_db_exists():
+                    return self.currency_tuples
+                currency_tuples = self.load_currency_data()
+                cache.set(key, currency_tuples)
+            CurrencyTuple._process_cache = (version, currency_tuples)
+        self.currency_tuples = list(currency_tuples)
         return self.currency_tuples
 
 
+def get_sync_base_date():
+    try:
+        return SyncParameter.objects.get(param_name='base_date').param_value
+    except SyncParameter.DoesNotExist:
+        return None
+
 
 def index(request):
     """
     Метод для главной страницы.
-    В нем осуществляется базовая логика загрузки данных в базу.
+    Синхронизация ставится в очередь и выполняется обработчиком
+    (manage.py sync_worker); страница сразу возвращает номер задачи.
     """
     if request.method == 'POST':
         form = DateRangeForm(request.POST)
         if form.is_valid():
-            start_date = form.cleaned_data['start_date']
-            end_date = form.cleaned_data['end_date']
-            date_to_sync = start_date
-            """
-            Так как на данные числа курс отсутствует, то
-            для синхронизации выбирам следующее доступное.
-            """
-            if (
-                date_to_sync.month == 1
-                and date_to_sync.day >= 1
-                and date_to_sync.day <= 10
-            ):
-                date_to_sync = date_to_sync.replace(day=11)
-            currency_fetcher = CurrencyFetcher(start_date, end_date)
-            currency_data = currency_fetcher.fetch_currency_rates()
-            # currency_data = fetch_currency_rates(start_date, end_date)
-            country_currency_fetcher = CountryCurrencyFetcher()
-            # country_data = fetch_country_currencies()
-            country_data = country_currency_fetcher.fetch_country_currencies()
-            CurrencyRate.synchronize_currency_rates(currency_data)
-            CountryCurrency.synchronize_country_currencies(country_data)
-
-            # Сохранение параметра. Происходит разово
-            SyncParameter.objects.update_or_create(
-                param_name='base_date', defaults={'param_value': start_date}
+            job = SyncJob.objects.create(
+                start_date=form.cleaned_data['start_date'],
+                end_date=form.cleaned_data['end_date']
             )
-            relative_change_calculator = RelativeChangeCalculator(date_to_sync)
-            relative_changes = relative_change_calculator.calculate_relative_changes()
-            # Расчет относительных изменений и синхронизация
-            # relative_changes = calculate_relative_changes(date_to_sync)
-            RelativeChange.synchronize_relative_changes(relative_changes)
+            return render(request, 'currency_app/success.html', {'job': job})
+    else:
+        form = DateRangeForm()
+    return render(request, 'currency_app/index.html', {'form': form})
+
 
-            return render(request, 'currency_app/success.html')
+async def index_async(request):
+    """
+    Асинхронный вариант index для ASGI-сервера.
+    Синхронизация по-прежнему выполняется обработчиком очереди, поэтому
+    запрос не ждёт загрузки курсов: из базы нужна только запись задачи.
+    """
+    if request.method == 'POST':
+        form = DateRangeForm(request.POST)
+        if form.is_valid():
+            job = await SyncJob.objects.acreate(
+                start_date=form.cleaned_data['start_date'],
+                end_date=form.cleaned_data['end_date']
+            )
+            return render(request, 'currency_app/success.html', {'job': job})
     else:
         form = DateRangeForm()
     return render(request, 'currency_app/index.html', {'form': form})
 
 
+@require_GET
+def sync_job_status(request, job_id):
+    """
+    Состояние задачи синхронизации: статус, текущий этап,
+    длительность и количество строк по этапам.
+    """
+    job = get_object_or_404(SyncJob, pk=job_id)
+    return JsonResponse({
+        'id': job.pk,
+        'status': job.status,
+        'stage': job.stage,
+        'start_date': job.start_date.isoformat(),
+        'end_date': job.end_date.isoformat(),
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'duration': job.duration,
+        'stages': job.stages,
+        'error': job.error
+    })
+
+
+@timed('load_series')
+def load_relative_changes(
+        selected_currency,
+        start_date,
+        end_date,
+        base_date,
+        sync_base_date,
+        version,
+        pairs=()
+        ) -> dict:
+    """
+    Получение относительных изменений {валюта: (даты, значения)}.
+    Для длинных периодов берутся недельные или месячные агрегаты
+    (см. rollups.choose_period), чтобы не читать курсы за каждый день.
+    Изменения кросс-курсов пар pairs добавляются под ключами вида EUR/USD.
+    """
+    if base_date is None:
+        return {}
+    series = {}
+    if pairs:
+        series.update(cross_relative_change_series(
+            pairs, base_date, start_date, end_date, version
+        ))
+    if not selected_currency:
+        return series
+    series.update(load_currency_relative_changes(
+        selected_currency,
+        start_date,
+        end_date,
+        base_date,
+        sync_base_date,
+        version
+    ))
+    return series
+
+
+def load_currency_relative_changes(
+        selected_currency,
+        start_date,
+        end_date,
+        base_date,
+        sync_base_date,
+        version,
+        min_points=None
+        ) -> dict:
+    currencies = tuple(sorted(selected_currency))
+    series = {}
+    period = choose_period(start_date, end_date, min_points)
+    if period is not None:
+        series = rollup_relative_change_series(
+            period,
+            base_date,
+            currencies,
+            start_date,
+            end_date,
+            version
+        )
+        # Для валют без агрегатов за период (например, до запуска
+        # rebuild_rollups) берутся дневные курсы
+        currencies = tuple(
+            currency for currency in currencies if currency not in series
+        )
+        if not currencies:
+            return series
+    if base_date == sync_base_date:
+        # Для даты последней синхронизации изменения уже посчитаны
+        daily = stored_relative_change_series(
+            currencies,
+            start_date,
+            end_date,
+            version
+        )
+    else:
+        daily = relative_change_series(
+            base_date,
+            currencies,
+            start_date,
+            end_date,
+            version
+        )
+    return {**series, **daily}
+
+
 def relative_changes_view(request):
     currency_tuple = CurrencyTuple()
     currency_codes = currency_tuple.CURRENCY_CODES
+    sync_base_date = get_sync_base_date()
     # Метод для страницы с построением относительного графика.
     if request.method == 'POST':
         form = RelativeChangeForm(request.POST, currency_codes=currency_codes)
@@ -110,56 +256,208 @@ def relative_changes_view(request):
             start_date = form.cleaned_data['start_date']
             end_date = form.cleaned_data['end_date']
             selected_currency = set(form.cleaned_data['currency'])
-            """
-            Так как на данные числа курс отсутствует, то
-            для синхронизации выбирам следующее доступное.
-            """
-            if (
-                start_date.month == 1
-                and start_date.day >= 1
-                and start_date.day <= 10
-            ):
-                start_date = start_date.replace(day=11)
-            # Получение данных о относительных изменениях для выбранных стран
-            relative_changes = RelativeChange.objects.filter(
-                date__range=[start_date, end_date],
-                currency__in=selected_currency
+            pairs = form.cleaned_data['pairs']
+            base_date = form.cleaned_data['base_date'] or sync_base_date
+            version = get_data_version()
+            chart_cache = get_chart_cache()
+            chart_key = chart_cache_key(
+                selected_currency | {pair_label(pair) for pair in pairs},
+                start_date, end_date, base_date, version
             )
-            # Построение графика
-            plt.figure(figsize=(10, 6))
-            for currency in selected_currency:
-                country_changes = relative_changes.filter(currency=currency)
-                dates = [change.date for change in country_changes]
-                values = [change.relative_change for change in country_changes]
-                plt.plot(dates, values, label=currency)
-
-            plt.xlabel('Дата')
-            plt.ylabel('Относительное изменение(%)')
-            plt.title('Относительное изменение курса валют, %')
-            plt.legend()
-            plt.grid(True)
-            buffer = io.BytesIO()
-            plt.savefig(buffer, format='png')
-            buffer.seek(0)
-            image_png = buffer.getvalue()
-            buffer.close()
-            graphic = base64.b64encode(image_png)
-            graphic = graphic.decode('utf-8')
+            graphic = chart_cache.get(chart_key)
+            if graphic is None:
+                graphic = render_relative_changes(load_relative_changes(
+                    selected_currency,
+                    start_date,
+                    end_date,
+                    base_date,
+                    sync_base_date,
+                    version,
+                    pairs
+                ))
+                chart_cache.set(chart_key, graphic)
 
             return render(request, 'currency_app/relative_changes.html', {
                 'form': form,
-                'graphic': graphic
+                'graphic': graphic,
+                'date': base_date
             })
     else:
-        form = RelativeChangeForm(currency_codes=currency_codes)
-    try:
-        relative_date = SyncParameter.objects.get().param_value
-    except:
-        relative_date = 'В базе данных нет записей'
+        form = RelativeChangeForm(
+            currency_codes=currency_codes,
+            initial={'base_date': sync_base_date}
+        )
+    relative_date = sync_base_date or 'В базе данных нет записей'
 
     return render(
         request,
         'currency_app/relative_changes.html',
         {'form': form,
          'date': relative_date}
-    )
\ No newline at end of file
+    )
+
+
+async def relative_changes_view_async(request):
+    """
+    Асинхронный вариант relative_changes_view для ASGI-сервера.
+    Запросы к базе выполняются через sync_to_async, график строится
+    в пуле процессов (charts.get_render_executor), поэтому пока строится
+    один график, тот же процесс отвечает на другие запросы.
+    """
+    currency_codes = await sync_to_async(
+        lambda: CurrencyTuple().CURRENCY_CODES
+    )()
+    sync_base_date = await sync_to_async(get_sync_base_date)()
+    if request.method == 'POST':
+        form = RelativeChangeForm(request.POST, currency_codes=currency_codes)
+        if form.is_valid():
+            start_date = form.cleaned_data['start_date']
+            end_date = form.cleaned_data['end_date']
+            selected_currency = set(form.cleaned_data['currency'])
+            pairs = form.cleaned_data['pairs']
+            base_date = form.cleaned_data['base_date'] or sync_base_date
+            version = await sync_to_async(get_data_version)()
+            chart_cache = get_chart_cache()
+            chart_key = chart_cache_key(
+                selected_currency | {pair_label(pair) for pair in pairs},
+                start_date, end_date, base_date, version
+            )
+            graphic = await chart_cache.aget(chart_key)
+            if graphic is None:
+                series = await sync_to_async(load_relative_changes)(
+                    selected_currency,
+                    start_date,
+                    end_date,
+                    base_date,
+                    sync_base_date,
+                    version,
+                    pairs
+                )
+                graphic = await render_relative_changes_async(series)
+                await chart_cache.aset(chart_key, graphic)
+
+            return render(request, 'currency_app/relative_changes.html', {
+                'form': form,
+                'graphic': graphic,
+                'date': base_date
+            })
+    else:
+        form = RelativeChangeForm(
+            currency_codes=currency_codes,
+            initial={'base_date': sync_base_date}
+        )
+    relative_date = sync_base_date or 'В базе данных нет записей'
+
+    return render(
+        request,
+        'currency_app/relative_changes.html',
+        {'form': form,
+         'date': relative_date}
+    )
+
+
+@require_GET
+def series_api(request):
+    """
+    JSON API временных рядов: относительные изменения (kind=relative)
+    или курсы к рублю (kind=rate). Параметр pairs добавляет кросс-курсы
+    пар валют (pairs=EUR/USD,CNY/JPY). Ряды отдаются по столбцам:
+    {"series": {"USD": {"dates": [...], "values": [...]}}}.
+    Параметр points прореживает каждый ряд до заданного числа точек
+    (method=lttb или mean). Для method=mean относительные изменения
+    за длинные периоды берутся из агрегатов (см. rollups.choose_period).
+    """
+    form = SeriesQueryForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    query = form.cleaned_data
+    version = get_data_version()
+    base_date = None
+    if query['kind'] == 'rate':
+        series = dict(rate_series(
+            query['currencies'], query['start_date'], query['end_date'],
+            version
+        ))
+        series.update(cross_rate_series(
+            query['pairs'], query['start_date'], query['end_date'], version
+        ))
+    else:
+        base_date = query['base_date'] or get_sync_base_date()
+        if base_date is None:
+            return JsonResponse(
+                {'errors': {'base_date': ['В базе данных нет записей']}},
+                status=400
+            )
+        if query['points'] and query['method'] == 'mean':
+            # Средние по периодам можно считать по агрегатам, если их
+            # точек не меньше запрошенного числа
+            series = load_currency_relative_changes(
+                query['currencies'], query['start_date'], query['end_date'],
+                base_date, get_sync_base_date(), version,
+                min_points=query['points']
+            )
+        else:
+            series = dict(relative_change_series(
+                base_date, query['currencies'], query['start_date'],
+                query['end_date'], version
+            ))
+        series.update(cross_relative_change_series(
+            query['pairs'], base_date, query['start_date'],
+            query['end_date'], version
+        ))
+
+    # Кросс-курсы вроде JPY/USD меньше 0.01, для курсов нужно больше знаков
+    digits = 6 if query['kind'] == 'rate' else 4
+    payload = {}
+    for currency, (dates, values) in series.items():
+        dates, values = downsample(
+            dates, values, query['points'], query['method']
+        )
+        payload[currency] = {
+            'dates': [value.isoformat() for value in dates],
+            'values': [round(value, digits) for value in values]
+        }
+    return JsonResponse({
+        'kind': query['kind'],
+        'base_date': base_date.isoformat() if base_date else None,
+        'start_date': query['start_date'].isoformat(),
+        'end_date': query['end_date'].isoformat(),
+        'series': payload
+    })
+
+
+@require_GET
+def export_view(request, dataset):
+    """
+    Выгрузка курсов (dataset=rates) или относительных изменений
+    (dataset=relative_changes) в CSV или Parquet. Ответ передаётся
+    по частям по мере чтения строк из базы, поэтому память сервера
+    не зависит от размера выгрузки.
+    """
+    if dataset not in DATASETS:
+        raise Http404('Неизвестный набор данных')
+    form = ExportQueryForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    query = form.cleaned_data
+    if query['format'] == 'parquet' and not parquet_available():
+        return JsonResponse(
+            {'errors': {'format': ['Для Parquet нужен пакет pyarrow']}},
+            status=501
+        )
+    rows = export_rows(
+        dataset, query['currencies'], query['start_date'], query['end_date']
+    )
+    if query['format'] == 'parquet':
+        response = StreamingHttpResponse(
+            iter_parquet(dataset, rows),
+            content_type='application/vnd.apache.parquet'
+        )
+    else:
+        response = StreamingHttpResponse(
+            iter_csv(dataset, rows), content_type='text/csv; charset=utf-8'
+        )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{dataset}.{query["format"]}"'
+    )
+    return response
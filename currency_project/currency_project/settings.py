@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'currency_app.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,11 +76,84 @@ WSGI_APPLICATION = 'currency_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# База данных задаётся переменными окружения:
+# DB_ENGINE - sqlite (по умолчанию) или postgresql;
+# DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT - параметры подключения;
+# DB_CONN_MAX_AGE - время жизни постоянного соединения, с.
+# Для SQLite при подключении включается режим WAL (см. currency_app/db.py),
+# чтобы запись во время синхронизации не блокировала чтение.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'currency'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', ''),
+            'PORT': os.environ.get('DB_PORT', ''),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'OPTIONS': {
+                # Ожидание освобождения блокировки вместо ошибки
+                # "database is locked"
+                'timeout': 20,
+            },
+        }
     }
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Построенные графики хранятся в отдельном кэше. При нескольких процессах
+# сервера можно использовать FileBasedCache, чтобы кэш был общим.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'charts': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'currency-charts',
+        'TIMEOUT': 24 * 60 * 60,
+        'OPTIONS': {
+            # Около 100 КБ на график - не более ~20 МБ на процесс
+            'MAX_ENTRIES': 200,
+            'CULL_FREQUENCY': 4,
+        },
+    },
+}
+
+CHART_CACHE_ALIAS = 'charts'
+
+
+# Дисковый кэш ответов сайтов-источников (см. currency_app/http_cache.py).
+# TTL - срок в секундах, в течение которого копия используется без
+# обращения к сайту; после него выполняется условный запрос.
+# Архивы курсов за прошедшие периоды кэшируются бессрочно.
+# HTTP_CACHE = None отключает кэш.
+
+HTTP_CACHE = {
+    'DIR': BASE_DIR / 'http_cache',
+    'TTL': {
+        'iban': 7 * 24 * 60 * 60,
+        'finmarket': 60 * 60,
+        'finmarket_registry': 24 * 60 * 60,
+    },
+    # Записи, не использовавшиеся месяц, и самые старые записи сверх
+    # 500 МБ удаляются после каждой синхронизации
+    'MAX_AGE': 30 * 24 * 60 * 60,
+    'MAX_SIZE': 500 * 1024 * 1024,
 }
 
 
@@ -127,3 +202,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
+
+# Размер пакета при синхронизации таблиц (bulk_create / bulk_update).
+CURRENCY_SYNC_BATCH_SIZE = 500
+
+# Количество наборов относительных изменений, хранимых в LRU-кэше процесса.
+RELATIVE_CHANGES_CACHE_SIZE = 128
+
+# Доля HTTP-запросов, профилируемых cProfile (0 - выключено),
+# и каталог для сохранения профилей.
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = BASE_DIR / 'profiles'